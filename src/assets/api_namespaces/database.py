@@ -0,0 +1,71 @@
+from dataclasses import asdict
+from os import getenv
+from typing import override
+from flask import request
+from flask_jwt_extended import current_user
+from api_server import ApiNamespace
+from flask_restx import Resource, fields
+
+from data.db.database import ConnectionPool
+from data.db.query_statistics import QueryStatistics
+
+class DatabaseNamespace(ApiNamespace):
+    @override
+    def get_name(self) -> str:
+        return 'database'
+
+    @override
+    def get_path(self) -> str:
+        return 'database'
+
+    @override
+    def get_description(self) -> str:
+        return 'Database diagnostics.'
+
+    @override
+    def use_jwt(self):
+        return True
+
+api = DatabaseNamespace()
+
+StatementModel = api.namespace.model('Statement statistics', {
+    'fingerprint': fields.String(required=True, description='Statement with normalized literals.'),
+    'calls': fields.Integer(required=True, description='Number of executions.'),
+    'total_ms': fields.Float(required=True, description='Total execution time.'),
+    'mean_ms': fields.Float(required=True, description='Mean execution time.'),
+    'max_ms': fields.Float(required=True, description='Slowest execution time.'),
+    'rows': fields.Integer(required=True, description='Total rows returned or affected.'),
+    'histogram': fields.Raw(required=True, description='Executions per latency bucket.'),
+    'callers': fields.Raw(required=True, description='Executions per calling provider or writer.')
+})
+
+def _verify_owner() -> None:
+    owner_id = getenv('OWNER_ID')
+    if owner_id is None or current_user.id != int(owner_id):
+        api.namespace.abort(code=403)
+
+@api.namespace.route('/queries')
+class QueriesRoute(Resource):
+    from api_server.session_manager import SessionManager
+    @SessionManager.bind
+    def session_manager(self) -> SessionManager: ...
+
+    @api.namespace.doc(security="jsonWebToken", params={'top': 'Number of statements to return.'})
+    @api.namespace.marshal_list_with(StatementModel)
+    def get(self):
+        self.session_manager.verify(api)
+        _verify_owner()
+        top = request.args.get('top', 10, type=int)
+        return [statistics.marshal() for statistics in QueryStatistics().top(top)]
+
+@api.namespace.route('/pool')
+class PoolRoute(Resource):
+    from api_server.session_manager import SessionManager
+    @SessionManager.bind
+    def session_manager(self) -> SessionManager: ...
+
+    @api.namespace.doc(security="jsonWebToken")
+    def get(self):
+        self.session_manager.verify(api)
+        _verify_owner()
+        return asdict(ConnectionPool().statistics)
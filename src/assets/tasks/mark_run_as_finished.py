@@ -1,27 +1,27 @@
+from datetime import datetime
 from typing import override
 
+from data.db.database import DatabaseExecutor
 from utils.basic_types import TaskType
 from data.events.schedule import Schedule
-from tasks.task import TaskTemplate
+from tasks.task import RetryPolicy, TaskTemplate
 
 
 class Task_MarkRunAsFinished(TaskTemplate):
-    from bot import Bot
-    @Bot.bind
-    def bot(self) -> Bot: ...
-
-    from ui.schedule import SchedulePost
-    @SchedulePost.bind
-    def ui_schedule(self) -> SchedulePost: ...
+    from tasks import Tasks
+    @Tasks.bind
+    def tasks(self) -> Tasks: ...
 
     @override
     def type(self) -> TaskType: return TaskType.MARK_RUN_AS_FINISHED
 
+    @override
+    def retry_policy(self) -> RetryPolicy: return RetryPolicy(max_attempts=5)
+
     @override
     async def execute(self, obj: dict) -> None:
         if obj and obj["id"]:
-            Schedule(obj["guild"]).finish(obj["id"])
-            for guild in self.bot._client.guilds:
-                await self.ui_schedule.rebuild(guild.id)
+            await DatabaseExecutor().run(lambda: Schedule(obj["guild"]).finish(obj["id"]))
+            self.tasks.add_task(datetime.utcnow(), TaskType.REBUILD_SCHEDULE_POST, {"guild": obj["guild"]})
 
 
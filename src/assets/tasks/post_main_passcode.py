@@ -3,7 +3,7 @@ from typing import override
 from discord import Embed, TextChannel
 from models.channel_assignment import ChannelAssignmentStruct
 from utils.basic_types import ChannelFunction, RoleFunction, TaskType
-from tasks.task import TaskTemplate
+from tasks.task import RetryPolicy, TaskTemplate
 
 
 class Task_PostMainPasscode(TaskTemplate):
@@ -14,6 +14,9 @@ class Task_PostMainPasscode(TaskTemplate):
     @override
     def type(self) -> TaskType: return TaskType.POST_MAIN_PASSCODE
 
+    @override
+    def retry_policy(self) -> RetryPolicy: return RetryPolicy(max_attempts=5)
+
     @override
     def description(self, data: dict, timestamp: datetime) -> str:
         return f'Post Main Passcode for event {data["entry_id"]} at {timestamp.strftime("%Y-%m %H:%M ST")}'
@@ -29,7 +32,7 @@ class Task_PostMainPasscode(TaskTemplate):
 
             event = Schedule(obj["guild"]).get(obj["entry_id"])
             if event is None: return
-            channel_struct = ChannelAssignmentProvider().find(
+            channel_struct = await ChannelAssignmentProvider().find_async(
                 ChannelAssignmentStruct(
                     guild_id=obj["guild"],
                     function=ChannelFunction.PASSCODES,
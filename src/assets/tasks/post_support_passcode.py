@@ -7,7 +7,7 @@ from data_providers.channel_assignments import ChannelAssignmentProvider
 from data_providers.role_assignments import RoleAssignmentsProvider
 from utils.basic_types import ChannelFunction, RoleFunction, TaskType
 from data.events.schedule import Schedule
-from tasks.task import TaskTemplate
+from tasks.task import RetryPolicy, TaskTemplate
 
 
 class Task_PostSupportPasscode(TaskTemplate):
@@ -18,6 +18,9 @@ class Task_PostSupportPasscode(TaskTemplate):
     @override
     def type(self) -> TaskType: return TaskType.POST_SUPPORT_PASSCODE
 
+    @override
+    def retry_policy(self) -> RetryPolicy: return RetryPolicy(max_attempts=5)
+
     @override
     def description(self, data: dict, timestamp: datetime) -> str:
         return f'Post Support Passcode for event {data["entry_id"]} at {timestamp.strftime("%Y-%m %H:%M ST")}'
@@ -28,7 +31,7 @@ class Task_PostSupportPasscode(TaskTemplate):
         if obj and obj["guild"] and obj["entry_id"]:
             event = Schedule(obj["guild"]).get(obj["entry_id"])
             if event is None: return
-            channel_struct = ChannelAssignmentProvider().find(ChannelAssignmentStruct(
+            channel_struct = await ChannelAssignmentProvider().find_async(ChannelAssignmentStruct(
                 guild_id=obj["guild"],
                 event_type=event.type,
                 function=ChannelFunction.SUPPORT_PASSCODES
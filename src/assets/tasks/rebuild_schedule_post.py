@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Hashable, Optional, override
+
+from utils.basic_types import TaskType
+from tasks.task import TaskTemplate
+
+
+class Task_RebuildSchedulePost(TaskTemplate):
+    from ui.schedule import SchedulePost
+    @SchedulePost.bind
+    def ui_schedule(self) -> SchedulePost: ...
+
+    @override
+    def type(self) -> TaskType: return TaskType.REBUILD_SCHEDULE_POST
+
+    @override
+    def runtime_only(self) -> bool: return True
+
+    @override
+    def coalescing_key(self, data: dict) -> Optional[Hashable]:
+        return data.get("guild") if data else None
+
+    @override
+    def debounce(self) -> timedelta:
+        return timedelta(seconds=float(getenv('SCHEDULE_REBUILD_DEBOUNCE_SECONDS', '5')))
+
+    @override
+    def description(self, data: dict, timestamp: datetime) -> str:
+        return f'Rebuild the schedule post of guild {data["guild"]} at {timestamp.strftime("%Y-%m %H:%M ST")}'
+
+    @override
+    async def execute(self, obj: dict) -> None:
+        if obj and obj["guild"]:
+            await self.ui_schedule.rebuild(obj["guild"])
@@ -6,7 +6,7 @@ from data_providers.events import EventsProvider
 from models.channel_assignment import ChannelAssignmentStruct
 from models.event import EventStruct
 from utils.basic_types import ChannelDenominator, ChannelFunction, TaskType
-from tasks.task import TaskTemplate
+from tasks.task import RetryPolicy, TaskTemplate
 
 
 class Task_RemoveRecruitmentPost(TaskTemplate):
@@ -17,6 +17,9 @@ class Task_RemoveRecruitmentPost(TaskTemplate):
     @override
     def type(self) -> TaskType: return TaskType.REMOVE_RECRUITMENT_POST
 
+    @override
+    def retry_policy(self) -> RetryPolicy: return RetryPolicy(max_attempts=5)
+
     @override
     def description(self, data: dict, timestamp: datetime) -> str:
         return f'Remove Recruitment Post at {timestamp.strftime("%Y-%m %H:%M ST")}'
@@ -1,9 +1,9 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from typing import override
 
 
 from utils.basic_types import TaskType
-from tasks.task import TaskTemplate
+from tasks.task import Recurrence, TaskTemplate
 
 
 class Task_UpdateEurekaInfoPosts(TaskTemplate):
@@ -11,10 +11,6 @@ class Task_UpdateEurekaInfoPosts(TaskTemplate):
     @Bot.bind
     def bot(self) -> Bot: ...
 
-    from tasks import Tasks
-    @Tasks.bind
-    def tasks(self) -> Tasks: ...
-
     from data.eureka_info import EurekaInfo
     @EurekaInfo.bind
     def eureka_info(self) -> EurekaInfo: ...
@@ -27,22 +23,15 @@ class Task_UpdateEurekaInfoPosts(TaskTemplate):
     def type(self) -> TaskType: return TaskType.UPDATE_EUREKA_INFO_POSTS
 
     @override
-    async def handle_exception(self, e: Exception, obj: dict) -> None:
-        self.tasks.remove_all(TaskType.UPDATE_EUREKA_INFO_POSTS)
-        self.tasks.add_task(datetime.utcnow() + timedelta(minutes=1), TaskType.UPDATE_EUREKA_INFO_POSTS)
+    def runtime_only(self) -> bool: return True
 
     @override
-    def runtime_only(self) -> bool: return True
+    def recurrence(self) -> Recurrence: return Recurrence(timedelta(minutes=1), run_at_start=True)
 
     @override
     async def execute(self, obj: dict) -> None:
-        next_exec = datetime.utcnow() + timedelta(minutes=1)
-        try:
-            self.eureka_info.remove_old()
-            for guild in self.bot._client.guilds:
-                await self.ui_eureka_info.rebuild(guild.id)
-        finally:
-            self.tasks.remove_all(TaskType.UPDATE_EUREKA_INFO_POSTS)
-            self.tasks.add_task(next_exec, TaskType.UPDATE_EUREKA_INFO_POSTS)
+        self.eureka_info.remove_old()
+        for guild in self.bot._client.guilds:
+            await self.ui_eureka_info.rebuild(guild.id)
 
 
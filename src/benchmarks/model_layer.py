@@ -0,0 +1,79 @@
+"""Compares materializing rows as `Record` + non-slotted dataclass (the former
+`select` / `from_record` path) against row tuples + slotted structs created
+by `BaseStruct.row_converter`.
+
+No database is needed; the rows are synthetic `events` and `buttons` tuples
+shaped like the ones psycopg2 returns.
+
+Usage (from `src`):
+    python -m benchmarks.model_layer [rows]
+"""
+import sys
+import tracemalloc
+from dataclasses import field, fields, make_dataclass
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Any, Callable, List, Sequence, Tuple
+
+from discord import ButtonStyle
+
+from data.db.sql import Record
+from models._base import BaseStruct
+from models.button import ButtonStruct
+from models.event import EventStruct
+from utils.basic_types import ButtonType, Unassigned
+
+
+def _legacy_struct(cls: type) -> type:
+    """Copy of a struct without `slots=True`."""
+    namespace = {name: cls.__dict__[name] for name in ('db_table_name', 'type_name', 'identity', 'fixup_types',
+                                                       '__repr__', 'changes_since', 'marshal')}
+    return make_dataclass(f'Legacy{cls.__name__}',
+                          [(f.name, f.type, field(default=Unassigned)) for f in fields(cls)],
+                          bases=(BaseStruct,), namespace=namespace)
+
+
+def _events(count: int) -> Tuple[List[str], List[tuple]]:
+    fields = [f.name for f in EventStruct.__dataclass_fields__.values()]
+    start = datetime.utcnow()
+    return fields, [(i, i % 50, f'Guild {i % 50}', 'BA_NORMAL', start + timedelta(minutes=i), None,
+                     100000 + i, 'Raid Leader', False, 1000 + i % 9000, None, None, False, None, True)
+                    for i in range(count)]
+
+
+def _buttons(count: int) -> Tuple[List[str], List[tuple]]:
+    fields = [f.name for f in ButtonStruct.__dataclass_fields__.values()]
+    button_type = next(iter(ButtonType)).value
+    return fields, [(f'button-{i}', button_type, 200000 + i % 100, None, 300000 + i // 25, None,
+                     f'Label {i}', ButtonStyle.primary.value, i % 5, i % 25, None, i % 7, i // 25)
+                    for i in range(count)]
+
+
+def _measure(name: str, rows: List[tuple], materialize: Callable[[List[tuple]], List[Any]]) -> None:
+    start = perf_counter()
+    materialize(rows)
+    elapsed = perf_counter() - start
+    tracemalloc.start()
+    result = materialize(rows)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f'{name:<24} {elapsed * 1000:>10.1f} ms {memory / 1024 / 1024:>10.1f} MiB')
+
+
+def _compare(name: str, cls: type, fields: Sequence[str], rows: List[tuple]) -> None:
+    legacy = _legacy_struct(cls)
+    convert = cls.row_converter(fields)
+    _measure(f'{name} record', rows, lambda rows: [
+        legacy.from_record(record) for record in [Record(zip(fields, row)) for row in rows]])
+    _measure(f'{name} row tuple', rows, lambda rows: [convert(row) for row in rows])
+
+
+def main(count: int) -> None:
+    print(f'{count} rows per table')
+    _compare('events', EventStruct, *_events(count))
+    _compare('buttons', ButtonStruct, *_buttons(count))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,56 @@
+"""Compares per-statement latency of interpolated SQL against
+server-prepared statements produced by `_SQL`.
+
+Usage (from `src`, with the database variables of `.env` set):
+    python -m benchmarks.prepared_statements [iterations]
+"""
+import sys
+from datetime import datetime
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+from data.db.sql import Record, Transaction
+
+
+def _legacy_value(value) -> str:
+    """Literal rendering as done by the former `_SQL._convert_to_sql`."""
+    if isinstance(value, (int, bool)): return str(value)
+    if isinstance(value, str): return f"'{value}'"
+    if isinstance(value, datetime): return value.strftime("'%Y-%m-%d %H:%M'")
+    return 'null'
+
+
+def _measure(name: str, iterations: int, statement) -> None:
+    start = perf_counter()
+    for i in range(iterations):
+        statement(i)
+    elapsed = perf_counter() - start
+    print(f'{name:<24} {elapsed / iterations * 1_000_000:>10.1f} us/statement')
+
+
+def main(iterations: int) -> None:
+    with Transaction() as transaction:
+        transaction.custom_sql('create temporary table benchmark_events ('
+                               'id serial primary key, guild_id bigint, event_type varchar(30), '
+                               'timestamp timestamp, finished boolean)')
+        for i in range(1000):
+            transaction.sql('benchmark_events').insert(Record(
+                guild_id=i % 10, event_type='BA_NORMAL', timestamp=datetime.utcnow(), finished=False))
+
+        fields = ['id', 'guild_id', 'event_type', 'timestamp', 'finished']
+        _measure('interpolated select', iterations, lambda i: transaction.custom_sql(
+            f'select {", ".join(fields)} from benchmark_events '
+            f'where guild_id = {_legacy_value(i % 10)} and event_type = {_legacy_value("BA_NORMAL")}'))
+        _measure('prepared select', iterations, lambda i: transaction.sql('benchmark_events').select(
+            fields=fields, filter=Record(guild_id=i % 10, event_type='BA_NORMAL')))
+        _measure('interpolated insert', iterations, lambda i: transaction.custom_sql(
+            f'insert into benchmark_events (guild_id, event_type, finished) '
+            f'values ({_legacy_value(i)}, {_legacy_value("DRS")}, {_legacy_value(False)})'))
+        _measure('prepared insert', iterations, lambda i: transaction.sql('benchmark_events').insert(
+            Record(guild_id=i, event_type='DRS', finished=False)))
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
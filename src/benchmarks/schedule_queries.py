@@ -0,0 +1,32 @@
+"""Counts the statements `Schedule.load` issues for a guild, which should stay
+constant (the events and their party leaders) regardless of the number of events.
+
+Usage (from `src`, with the database variables of `.env` set):
+    python -m benchmarks.schedule_queries guild_id
+"""
+import sys
+
+from dotenv import load_dotenv
+
+from data.db.query_statistics import QueryStatistics
+from data.events.schedule import Schedule
+
+EXPECTED_STATEMENTS = 2
+
+
+def main(guild_id: int) -> int:
+    schedule = Schedule(guild_id)
+    statistics = QueryStatistics()
+    statistics.reset()
+    schedule.load()
+    statements = statistics.top(sys.maxsize)
+    for statement in statements:
+        print(f'{statement.calls:>6} x {statement.fingerprint}')
+    calls = sum(statement.calls for statement in statements)
+    print(f'{calls} statements for {len(schedule.all)} events (expected {EXPECTED_STATEMENTS})')
+    return 0 if calls <= EXPECTED_STATEMENTS else 1
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    sys.exit(main(int(sys.argv[1])))
@@ -1,19 +1,28 @@
 
+from asyncio import Task, create_task
 from datetime import datetime
 from os import getenv
 from typing import Literal, Optional
 from centralized_data import Singleton
-from discord.ext import tasks
 from discord import HTTPException, Member, Object, RawMessageDeleteEvent
 from discord.ext.commands import Bot as DiscordBot, guild_only, Context, Greedy
 
 # TODO: webserver - from api_server import ApiServer
+from data.db.database import DatabaseExecutor
+from data.db.notifications import ChangeListener
+from data.events.schedule import Schedule
+from data_providers._base import BaseProvider
+from data_providers.buttons import ButtonsProvider
+from data_providers.channel_assignments import ChannelAssignmentProvider
+from data_providers.event_templates import EventTemplateProvider
+from data_providers.message_assignments import MessageAssignmentsProvider
+from data_providers.role_assignments import RoleAssignmentsProvider
 from data_providers.context import basic_context
 from utils.basic_types import TaskType
 from bot import Bot
 from data.cache.message_cache import MessageCache
 from tasks import Tasks
-from utils.logger import GuildLogger
+from utils.logger import ConsoleLogger, GuildLogger
 
 from commands.admin import AdminCommands
 from commands.ba import BACommands
@@ -37,8 +46,15 @@ async def setup_hook(client: DiscordBot):
     await client.add_cog(BACommands())
     await client.add_cog(LogosCommands())
     await client.add_cog(AdminCommands())
-    if not task_loop.is_running():
-        task_loop.start()
+    listener = ChangeListener()
+    listener.subscribe('events', Schedule.invalidate)
+    listener.subscribe('tasks', Tasks().invalidate)
+    for provider in (ButtonsProvider(), ChannelAssignmentProvider(), EventTemplateProvider(),
+                     MessageAssignmentsProvider(), RoleAssignmentsProvider()):
+        listener.subscribe(provider.struct_type().db_table_name(), provider.invalidate)
+    listener.start()
+    if _task_loop is None or _task_loop.done():
+        _start_task_loop()
 
 
 def _load_singleton(singleton: Singleton, initial: bool = False):
@@ -46,22 +62,18 @@ def _load_singleton(singleton: Singleton, initial: bool = False):
         singleton.load()
 
 from ui.button_loader import ButtonLoader
-from ui.schedule import SchedulePost
 
 async def reload_hook(client: DiscordBot, initial: bool):
-    ui_schedule = SchedulePost()
+    if not initial:
+        from data.db.definition import TableDefinitions
+        TableDefinitions().refresh_catalog()
+        BaseProvider.invalidate_all()
     MessageCache().clear()
     ButtonLoader().load()
-    for guild in client.guilds:
-        await ui_schedule.rebuild(guild.id)
-
     tasks = Tasks()
     _load_singleton(tasks, initial)
-
-    if not tasks.contains(TaskType.UPDATE_STATUS):
-        tasks.add_task(datetime.utcnow(), TaskType.UPDATE_STATUS)
-    if not tasks.contains(TaskType.UPDATE_EUREKA_INFO_POSTS):
-        tasks.add_task(datetime.utcnow(), TaskType.UPDATE_EUREKA_INFO_POSTS)
+    for guild in client.guilds:
+        tasks.add_task(datetime.utcnow(), TaskType.REBUILD_SCHEDULE_POST, {"guild": guild.id})
 
 client = Bot()._client
 
@@ -85,7 +97,7 @@ async def on_raw_message_delete(payload: RawMessageDeleteEvent):
     from data_writers.buttons import ButtonsWriter
     from models.button import ButtonStruct
     from utils.logger import FileLogger
-    ButtonsWriter().remove(
+    await ButtonsWriter().remove_async(
         ButtonStruct(message_id=payload.message_id),
         basic_context(0, 0, FileLogger(payload.guild_id)))
 
@@ -122,20 +134,26 @@ async def sync(ctx: Context, guilds: Greedy[Object], spec: Optional[Literal["~",
 
     await ctx.send(f"Synced the tree to {ret}/{len(guilds)}.")
 
-@tasks.loop(seconds=1) # The delay is calculated from the end of execution of the last task.
-async def task_loop(): # You can think of it as sleep(1000) after the last procedure finished
-    """Main loop, which runs required tasks at required times. await is necessery."""
-    if client.ws:
-        tasks = Tasks()
-        task = tasks.get_next()
-        if task is None: return
-        if tasks.executing: return
-        tasks.executing = True
-        try:
-            await task.execute()
-        finally:
-            tasks.remove_task(task)
-            tasks.executing = False
+_task_loop: Optional[Task] = None
+
+TASK_LOOP_RESTART_DELAY = 5
+"""Seconds before the task loop is restarted after it failed."""
+
+async def task_loop():
+    """Main loop, which runs required tasks at required times."""
+    await client.wait_until_ready()
+    await Tasks().run()
+
+def _start_task_loop() -> None:
+    global _task_loop
+    _task_loop = create_task(task_loop())
+    _task_loop.add_done_callback(_restart_task_loop)
+
+def _restart_task_loop(task: Task) -> None:
+    """Log why the task loop ended and start it again, so that the tasks do not silently stop."""
+    if task.cancelled(): return
+    ConsoleLogger().log(f'task loop ended ({task.exception()!r}), restarting in {TASK_LOOP_RESTART_DELAY}s.')
+    task.get_loop().call_later(TASK_LOOP_RESTART_DELAY, _start_task_loop)
 
 client.krile_setup_hook = setup_hook
 client.krile_reload_hook = reload_hook
\ No newline at end of file
@@ -5,7 +5,7 @@ from discord.ext.commands import GroupCog
 from discord.app_commands import check, command
 from discord import Interaction
 from data.db.definition import TableDefinitions
-from data.db.sql import Record
+from data.db.sql import ReadOnlyConnection, SchemaCatalog
 from utils.functions import default_defer, default_response
 from data.validation.permission_validator import PermissionValidator
 from utils.logger import guild_log_message
@@ -30,11 +30,12 @@ class AdminCommands(GroupCog, group_name='admin', group_description='Bot adminis
         where = f' where {filter}' if filter else ''
         order_by = f' order by {order}' if order else ''
         if fields == '*':
-            column_names = [column["name"] for column in next(
-                (definition for definition in self.table_definitions.loaded_assets if definition.name() == table), None).source["columns"]]
+            column_names = SchemaCatalog().columns(table)
+            fields = ', '.join(column_names)
         else:
             column_names = [name.strip() for name in fields.split(',')]
-        result = Record()._database.query(f'select {fields} from {table}{where}{order_by} limit 25')
+        with ReadOnlyConnection() as connection:
+            result = connection.custom_sql(f'select {fields} from {table}{where}{order_by} limit 25')
         pandas.set_option('display.expand_frame_repr', False)
         pandas.set_option('display.width', 240)
         response = pandas.DataFrame(result, columns=column_names)
@@ -42,6 +43,71 @@ class AdminCommands(GroupCog, group_name='admin', group_description='Bot adminis
         await default_response(interaction, response)
 
 
+    @command(name = "pool", description = "Shows database connection pool statistics.")
+    @check(PermissionValidator().is_admin)
+    async def pool(self, interaction: Interaction):
+        await default_defer(interaction)
+        from data.db.database import ConnectionPool
+        stats = ConnectionPool().statistics
+        await default_response(interaction, (
+            f'```\n'
+            f'size:          {stats.size} ({stats.in_use} in use, {stats.idle} idle)\n'
+            f'acquisitions:  {stats.acquisitions}\n'
+            f'waits:         {stats.waits} ({stats.wait_time:.3f}s total, {stats.max_wait_time:.3f}s max)\n'
+            f'created:       {stats.created}\n'
+            f'recycled:      {stats.recycled} ({stats.health_check_failures} failed health checks)\n'
+            f'```'))
+
+    @command(name = "queries", description = "Shows the most expensive database statements.")
+    @check(PermissionValidator().is_admin)
+    async def queries(self, interaction: Interaction, top: Optional[int] = 10):
+        await default_defer(interaction)
+        from data.db.query_statistics import QueryStatistics
+        lines = [f'{"calls":>7} {"total ms":>10} {"mean ms":>8} {"max ms":>8} {"rows":>8}  statement']
+        for statistics in QueryStatistics().top(min(max(top, 1), 25)):
+            statement = statistics.fingerprint if len(statistics.fingerprint) <= 60 else statistics.fingerprint[:57] + '...'
+            lines.append(f'{statistics.calls:>7} {statistics.total_time * 1000:>10.1f} {statistics.mean_time * 1000:>8.1f} '
+                         f'{statistics.max_time * 1000:>8.1f} {statistics.rows:>8}  {statement}')
+        response = '\n'.join(lines)
+        await default_response(interaction, f'```\n{response[:1900]}\n```')
+
+    @command(name = "tasks", description = "Shows the task queue and how late the tasks started.")
+    @check(PermissionValidator().is_admin)
+    async def tasks(self, interaction: Interaction):
+        await default_defer(interaction)
+        from tasks.statistics import TaskStatistics
+        queue = TaskStatistics().queue
+        lines = [f'scheduled: {queue.scheduled}, ready: {queue.ready} (max {queue.max_ready}), '
+                 f'running: {queue.running} (max {queue.max_running})',
+                 '',
+                 f'{"executed":>8} {"merged":>7} {"mean lag ms":>12} {"max lag ms":>12}  task type']
+        for statistics in TaskStatistics().all():
+            lines.append(f'{statistics.executed:>8} {statistics.merged:>7} {statistics.mean_lag * 1000:>12.1f} '
+                         f'{statistics.max_lag * 1000:>12.1f}  {statistics.task_type.value}')
+        response = '\n'.join(lines)
+        await default_response(interaction, f'```\n{response[:1900]}\n```')
+
+    @command(name = "failed_tasks", description = "Shows the tasks which failed and will not be retried.")
+    @check(PermissionValidator().is_admin)
+    async def failed_tasks(self, interaction: Interaction):
+        await default_defer(interaction)
+        from tasks import Tasks
+        lines = [f'{"id":>6} {"failed at":<16} {"attempts":>8}  task type / error']
+        for record in Tasks().dead_letters():
+            lines.append(f'{record["id"]:>6} {record["failed_at"].strftime("%Y-%m-%d %H:%M")} {record["attempts"] or 0:>8}  '
+                         f'{record["task_type"]}: {str(record["error"])[:60]}')
+        response = '\n'.join(lines)
+        await default_response(interaction, f'```\n{response[:1900]}\n```')
+
+    @command(name = "replay_task", description = "Queues a failed task again.")
+    @check(PermissionValidator().is_owner)
+    async def replay_task(self, interaction: Interaction, id: int):
+        await default_defer(interaction)
+        from tasks import Tasks
+        if Tasks().replay(id) is None:
+            return await default_response(interaction, f'Failed task {id} does not exist.')
+        await default_response(interaction, f'Failed task {id} was queued again.')
+
     @command(name = "reload", description = "Loads all bot data from the database again.")
     @check(PermissionValidator().is_owner)
     async def reload(self, interaction: Interaction):
@@ -57,6 +123,11 @@ class AdminCommands(GroupCog, group_name='admin', group_description='Bot adminis
 
     #region error-handling
     @query.error
+    @pool.error
+    @queries.error
+    @tasks.error
+    @failed_tasks.error
+    @replay_task.error
     @reload.error
     async def handle_error(self, interaction: Interaction, error):
         print(error)
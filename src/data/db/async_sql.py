@@ -0,0 +1,100 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Iterable, List, Optional, Self, Tuple, Type, Union, override
+
+from data.db.database import DatabaseExecutor, PgColumnValue
+from data.db.sql import SQL_ALL_FIELDS, _SQL, _BasicConnection, ReadOnlyConnection, Record, Records, Transaction
+
+
+class _AsyncBasicConnection(ABC):
+    """Awaitable counterpart of `_BasicConnection`. Every statement runs
+    on a `DatabaseExecutor` worker, the event loop only awaits the result.
+
+    Usage:
+    ```python
+    async with AsyncTransaction() as transaction:
+        records = await transaction.sql('events').select(filter=Record(guild_id=guild_id))
+    ```
+    """
+
+    @DatabaseExecutor.bind
+    def _executor(self) -> DatabaseExecutor: ...
+
+    def __init__(self):
+        self._connection = self.connection_type()()
+
+    @abstractmethod
+    def connection_type(self) -> Type[_BasicConnection]: ...
+
+    @abstractmethod
+    def _commit_on_exit(self, exc_type: Optional[type]) -> bool: ...
+
+    async def __aenter__(self) -> Self:
+        await self._executor.run(self._connection._database.connect)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self._executor.run(self._connection._database.disconnect, self._commit_on_exit(exc_type))
+
+    def sql(self, table_name: str) -> _AsyncSQL:
+        """Create an awaitable SQL object for the given table name."""
+        return _AsyncSQL(table_name, self._connection)
+
+    async def custom_sql(self, statement: str) -> List[PgColumnValue]:
+        """Execute a custom SQL statement."""
+        return await self._executor.run(self._connection.custom_sql, statement)
+
+
+class AsyncTransaction(_AsyncBasicConnection):
+    @override
+    def connection_type(self) -> Type[_BasicConnection]: return Transaction
+
+    @override
+    def _commit_on_exit(self, exc_type: Optional[type]) -> bool: return exc_type is None
+
+
+class AsyncReadOnlyConnection(_AsyncBasicConnection):
+    @override
+    def connection_type(self) -> Type[_BasicConnection]: return ReadOnlyConnection
+
+    @override
+    def _commit_on_exit(self, exc_type: Optional[type]) -> bool: return False
+
+
+class _AsyncSQL:
+    """Awaitable counterpart of `_SQL`. Without a connection, every
+    statement borrows a pooled connection on its own."""
+
+    @DatabaseExecutor.bind
+    def _executor(self) -> DatabaseExecutor: ...
+
+    def __init__(self, table_name: str, connection: Optional[_BasicConnection] = None):
+        self._sql = _SQL(table_name, connection)
+
+    async def select(self, *,
+                     fields: List[str] = SQL_ALL_FIELDS,
+                     where: str = '',
+                     filter: Optional[Record] = None,
+                     all: bool = True,
+                     sort_fields: List[str | Tuple[str, bool]] = [],
+                     group_by: List[str] = []) -> Records:
+        return await self._executor.run(self._sql.select, fields=fields, where=where, filter=filter,
+                                        all=all, sort_fields=sort_fields, group_by=group_by)
+
+    async def insert(self, record: Record, returning_field: str = '') -> PgColumnValue:
+        return await self._executor.run(self._sql.insert, record, returning_field)
+
+    async def insert_many(self, records: List[Record], returning_field: str = '') -> List[PgColumnValue]:
+        return await self._executor.run(self._sql.insert_many, records, returning_field)
+
+    async def bulk_load(self, records: Iterable[Record], fields: List[str]) -> int:
+        return await self._executor.run(self._sql.bulk_load, records, fields)
+
+    async def update(self, record: Record, condition: Union[Record, str]) -> None:
+        await self._executor.run(self._sql.update, record, condition)
+
+    async def delete(self, condition: Union[str, Record]) -> None:
+        await self._executor.run(self._sql.delete, condition)
+
+    async def drop(self) -> None:
+        await self._executor.run(self._sql.drop)
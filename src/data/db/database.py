@@ -1,8 +1,19 @@
-from typing import Any, List, Union
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import count
+import re
+from threading import Condition
+from time import monotonic, perf_counter
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union, override
+from centralized_data import Bindable
 import psycopg2
+from psycopg2.extras import execute_values
 import os
 from datetime import datetime
 
+from data.db.query_statistics import QueryStatistics
 from utils.basic_types import UNASSIGNED_TYPE
 
 
@@ -12,6 +23,265 @@ def pg_timestamp(timestamp: datetime):
 
 PgColumnValue = Union[Any, str, int, bool, datetime, UNASSIGNED_TYPE]
 
+DEFAULT_FETCH_SIZE = 1000
+"""Rows fetched per round trip by server-side cursors."""
+
+MAX_PREPARED_STATEMENTS = 256
+"""Per connection. When reached, all prepared statements of the connection are deallocated."""
+
+_PLACEHOLDER = re.compile(r'%s|%%')
+
+
+def numbered_placeholders(statement: str) -> str:
+    """Convert psycopg2 `%s` placeholders into Postgres `$n` parameters."""
+    counter = 0
+    def replace(match: re.Match) -> str:
+        nonlocal counter
+        if match.group() == '%%': return '%'
+        counter += 1
+        return f'${counter}'
+    return _PLACEHOLDER.sub(replace, statement)
+
+
+def open_connection() -> Any:
+    """Open a new connection configured by the `DB_*` environment variables."""
+    return psycopg2.connect(
+        database=os.getenv('DB_NAME'),
+        host=os.getenv('DB_HOST'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASS'),
+        port=os.getenv('DB_PORT')
+    )
+
+
+@dataclass
+class PoolStatistics:
+    """Snapshot of the connection pool usage, used to size the pool."""
+    size: int
+    idle: int
+    in_use: int
+    acquisitions: int
+    waits: int
+    """How many acquisitions had to wait for a connection to be released."""
+    wait_time: float
+    """Total time in seconds spent waiting for a connection."""
+    max_wait_time: float
+    created: int
+    recycled: int
+    """Connections closed because of max lifetime or a failed health check."""
+    health_check_failures: int
+
+
+class _PooledConnection:
+    def __init__(self, connection: Any):
+        self.connection = connection
+        self.created_at = monotonic()
+        self.released_at = self.created_at
+        self.prepared_statements: Dict[str, str] = {}
+
+
+class ConnectionPool(Bindable):
+    """Process wide pool of Postgres connections.
+
+    Configured through the environment:
+    * `DB_POOL_MIN_SIZE` - connections opened upfront (default 1)
+    * `DB_POOL_MAX_SIZE` - upper bound of open connections (default 10)
+    * `DB_POOL_TIMEOUT` - seconds to wait for a free connection (default 30)
+    * `DB_POOL_MAX_LIFETIME` - seconds after which a connection is recycled (default 3600)
+    * `DB_POOL_HEALTH_CHECK_AFTER` - idle seconds after which a connection
+      is pinged before being handed out (default 60)
+    """
+
+    @override
+    def constructor(self) -> None:
+        super().constructor()
+        self.min_size = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+        self.max_size = max(int(os.getenv('DB_POOL_MAX_SIZE', '10')), 1)
+        self.timeout = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+        self.max_lifetime = float(os.getenv('DB_POOL_MAX_LIFETIME', '3600'))
+        self.health_check_after = float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', '60'))
+        self._condition = Condition()
+        self._idle: List[_PooledConnection] = []
+        self._in_use: dict[int, _PooledConnection] = {}
+        self._reserved = 0
+        """Slots taken by acquisitions which connect or health-check outside of the lock."""
+        self._acquisitions = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._created = 0
+        self._recycled = 0
+        self._health_check_failures = 0
+        with self._condition:
+            for _ in range(min(self.min_size, self.max_size)):
+                self._idle.append(self._open())
+
+    def _open(self) -> _PooledConnection:
+        self._created += 1
+        return _PooledConnection(open_connection())
+
+    def _close(self, pooled: _PooledConnection) -> None:
+        self._recycled += 1
+        try:
+            pooled.connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_expired(self, pooled: _PooledConnection) -> bool:
+        return self.max_lifetime > 0 and monotonic() - pooled.created_at > self.max_lifetime
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        if pooled.connection.closed: return False
+        if monotonic() - pooled.released_at < self.health_check_after: return True
+        try:
+            with pooled.connection.cursor() as cursor:
+                cursor.execute('select 1')
+            pooled.connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @property
+    def size(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._reserved
+
+    def acquire(self) -> Any:
+        """Borrow a connection from the pool. Blocks until one is available
+        or `DB_POOL_TIMEOUT` runs out.
+
+        Only the slot is reserved under the lock; opening a connection and
+        the health check happen outside of it, so that other acquisitions
+        and releases do not wait for that network round trip."""
+        with self._condition:
+            self._acquisitions += 1
+        waited_since = None
+        while True:
+            pooled, waited_since = self._reserve(waited_since)
+            if pooled is None:
+                try:
+                    pooled = _PooledConnection(open_connection())
+                except BaseException:
+                    self._cancel_reservation()
+                    raise
+                with self._condition:
+                    self._created += 1
+                    return self._checkout(pooled, waited_since)
+            expired = self._is_expired(pooled)
+            if not expired and self._is_healthy(pooled):
+                with self._condition:
+                    return self._checkout(pooled, waited_since)
+            try:
+                pooled.connection.close()
+            except psycopg2.Error:
+                pass
+            self._cancel_reservation(recycled=True, unhealthy=not expired)
+
+    def _reserve(self, waited_since: float | None) -> Tuple[Optional[_PooledConnection], float | None]:
+        """Take an idle connection or, if the pool may grow, a slot for a new one (None)."""
+        with self._condition:
+            while True:
+                if self._idle:
+                    self._reserved += 1
+                    return self._idle.pop(), waited_since
+                if self.size < self.max_size:
+                    self._reserved += 1
+                    return None, waited_since
+                if waited_since is None:
+                    waited_since = monotonic()
+                    self._waits += 1
+                remaining = self.timeout - (monotonic() - waited_since)
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    self._record_wait(waited_since)
+                    raise TimeoutError(f'no database connection available after {self.timeout}s '
+                                       f'(pool size: {self.max_size}).')
+
+    def _cancel_reservation(self, recycled: bool = False, unhealthy: bool = False) -> None:
+        with self._condition:
+            self._reserved -= 1
+            if recycled: self._recycled += 1
+            if unhealthy: self._health_check_failures += 1
+            self._condition.notify()
+
+    def _record_wait(self, waited_since: float | None) -> None:
+        if waited_since is None: return
+        waited = monotonic() - waited_since
+        self._wait_time += waited
+        self._max_wait_time = max(self._max_wait_time, waited)
+
+    def _checkout(self, pooled: _PooledConnection, waited_since: float | None) -> Any:
+        self._reserved -= 1
+        self._record_wait(waited_since)
+        self._in_use[id(pooled.connection)] = pooled
+        return pooled.connection
+
+    def release(self, connection: Any, discard: bool = False) -> None:
+        """Return a borrowed connection. Broken or expired connections
+        are closed instead of being put back."""
+        with self._condition:
+            pooled = self._in_use.pop(id(connection), None)
+            if pooled is None:
+                raise Exception('release of a connection that does not belong to the pool')
+            if discard or connection.closed or self._is_expired(pooled):
+                self._close(pooled)
+            else:
+                pooled.released_at = monotonic()
+                self._idle.append(pooled)
+            self._condition.notify()
+
+    def prepared_statements(self, connection: Any) -> Dict[str, str]:
+        """Statements prepared on a borrowed connection, mapped to their names."""
+        return self._in_use[id(connection)].prepared_statements
+
+    def close_all(self) -> None:
+        """Close all idle connections, e.g. after the database was restarted."""
+        with self._condition:
+            while self._idle:
+                self._close(self._idle.pop())
+
+    @property
+    def statistics(self) -> PoolStatistics:
+        with self._condition:
+            return PoolStatistics(
+                size=self.size,
+                idle=len(self._idle),
+                in_use=len(self._in_use),
+                acquisitions=self._acquisitions,
+                waits=self._waits,
+                wait_time=self._wait_time,
+                max_wait_time=self._max_wait_time,
+                created=self._created,
+                recycled=self._recycled,
+                health_check_failures=self._health_check_failures
+            )
+
+
+T = TypeVar('T')
+
+_DATA_MODIFICATION = re.compile(r'\s*(insert|update|delete)\b', re.IGNORECASE)
+"""Statements whose `RETURNING` value `Database.query` returns as a scalar."""
+
+
+class DatabaseExecutor(Bindable):
+    """Dedicated worker threads for database access from coroutines,
+    so that slow queries never block the discord.py event loop.
+
+    A worker may hold two pooled connections at once, e.g. a writer's
+    transaction and the read-only connection of the provider it queries.
+    The executor therefore gets half of the pool (`DB_POOL_MAX_SIZE`), so
+    that busy workers cannot exhaust the pool while each waits for its second
+    connection, and code on the event loop still finds free connections."""
+
+    @override
+    def constructor(self) -> None:
+        super().constructor()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(ConnectionPool().max_size // 2, 1),
+            thread_name_prefix='database')
+
+    async def run(self, method: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking database method on a worker thread and await its result."""
+        return await get_running_loop().run_in_executor(self._executor, partial(method, *args, **kwargs))
+
 
 class Database:
     """Runtime database access dict
@@ -20,13 +290,21 @@ class Database:
     ----------
     _connection_counter: :class:`int`
         Depth of connection requests. When the counter reaches 0,
-        database will commit changes and close the connection.
+        database will commit changes and return the connection to the pool.
     _connection: :class:`pgConnection`
-        Currently opened connection.
+        Currently borrowed connection.
     _cursor: :class: `pgCursor`
         Currently used cursor for the connection
     """
 
+    @ConnectionPool.bind
+    def _pool(self) -> ConnectionPool: ...
+
+    @QueryStatistics.bind
+    def _statistics(self) -> QueryStatistics: ...
+
+    _cursor_names = count(1)
+
     def __init__(self):
         self._connection_counter: int = 0
         self._connection: Any = None
@@ -36,55 +314,146 @@ class Database:
         return self._connection_counter > 0
 
     def connect(self):
-        """Connect to Postgres. If already active, _connection_counter is incremented."""
+        """Borrow a connection from the pool. If already active, _connection_counter is incremented."""
         if not self._connection_counter:
-            self._connection = psycopg2.connect(
-                database=os.getenv('DB_NAME'),
-                host=os.getenv('DB_HOST'),
-                user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASS'),
-                port=os.getenv('DB_PORT')
-            )
+            self._connection = self._pool.acquire()
             self._cursor = self._connection.cursor()
 
         self._connection_counter += 1
 
     def disconnect(self, commit: bool = True):
-        """Disconnect from Postgres and save the changes. If multiple
+        """Save the changes and return the connection to the pool. If multiple
         `connect()`'s were called, the _connection_counter is decremented."""
         if not self._connection_counter:
             raise Exception('disconnect without prior connect')
 
         self._connection_counter -= 1
         if not self._connection_counter:
-            if commit:
-                self._connection.commit()
-            else:
-                self._connection.rollback()
-            self._connection.close()
+            broken = False
+            try:
+                self._cursor.close()
+                if commit:
+                    self._connection.commit()
+                else:
+                    self._connection.rollback()
+            except psycopg2.Error:
+                broken = True
+                raise
+            finally:
+                self._pool.release(self._connection, discard=broken)
+                self._connection = None
+                self._cursor = None
 
-    def query(self, query: str) -> List[PgColumnValue]:
+    def _execute_prepared(self, query: str, params: Sequence[Any]) -> None:
+        statements = self._pool.prepared_statements(self._connection)
+        name = statements.get(query)
+        if name is None:
+            if len(statements) >= MAX_PREPARED_STATEMENTS:
+                self._cursor.execute('deallocate all')
+                statements.clear()
+            name = f'krile_{len(statements) + 1}'
+            self._cursor.execute(f'prepare {name} as {numbered_placeholders(query)}')
+            statements[query] = name
+        if params:
+            self._cursor.execute(f'execute {name} ({", ".join(["%s"] * len(params))})', params)
+        else:
+            self._cursor.execute(f'execute {name}')
+
+    def query(self, query: str,
+              params: Optional[Sequence[Any]] = None,
+              prepare: bool = False) -> List[PgColumnValue]:
         """Execute a query on the current cursor.
 
         Args:
-            query (str): SQL string to be executed.
+            query (str): SQL string to be executed. Values are passed
+                as `%s` placeholders when `params` are provided.
+            params (Sequence): Values bound to the placeholders.
+            prepare (bool): Prepare the statement on the server and reuse
+                the plan for every following call with the same statement.
 
         Returns:
             Union[str, None]:
-                SELECT statement returns an array of row arrays.
+                INSERT, UPDATE or DELETE with RETURNING returns the value which is requested.
 
-                INSERT INTO RETURNING returns the value which is requested.
+                Other statements returning rows (SELECT, WITH, EXPLAIN, VALUES, SHOW...)
+                return an array of row arrays.
 
                 Other queries return an empty array.
         """
         self.connect()
+        started = perf_counter()
+        rows = 0
         try:
-            self._cursor.execute(query)
-            if 'select' in query:
-                return self._cursor.fetchall()
-            elif 'returning' in query:
-                return self._cursor.fetchone()[0]
+            if prepare:
+                self._execute_prepared(query, params or [])
             else:
+                self._cursor.execute(query, params)
+            rows = self._cursor.rowcount
+            if self._cursor.description is None:
                 return []
+            elif _DATA_MODIFICATION.match(query):
+                return self._cursor.fetchone()[0]
+            else:
+                result = self._cursor.fetchall()
+                rows = len(result)
+                return result
+        finally:
+            self._statistics.record(query, perf_counter() - started, rows)
+            self.disconnect()
+
+    def query_iter(self, query: str,
+                   params: Optional[Sequence[Any]] = None,
+                   fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Sequence[PgColumnValue]]:
+        """Stream the rows of a SELECT statement through a named server-side cursor,
+        fetching `fetch_size` rows per round trip.
+
+        The connection stays borrowed until the iterator is exhausted or closed,
+        so other statements may be executed on it in the meantime.
+        """
+        self.connect()
+        started = perf_counter()
+        rows = 0
+        cursor = self._connection.cursor(name=f'krile_cursor_{next(self._cursor_names)}')
+        try:
+            cursor.itersize = fetch_size
+            cursor.execute(query, params)
+            for row in cursor:
+                rows += 1
+                yield row
+        finally:
+            try:
+                cursor.close()
+            except psycopg2.Error:
+                pass
+            self._statistics.record(query, perf_counter() - started, rows)
+            self.disconnect()
+
+    def query_many(self, query: str, rows: Sequence[Sequence[Any]], fetch: bool = False) -> List[PgColumnValue]:
+        """Execute a statement with a single `VALUES %s` placeholder for all rows at once.
+
+        Returns:
+            List: the rows of the `RETURNING` clause if `fetch` is set, otherwise an empty array.
+        """
+        if not rows: return []
+        self.connect()
+        started = perf_counter()
+        try:
+            return execute_values(self._cursor, query, rows, page_size=len(rows), fetch=fetch) or []
+        finally:
+            self._statistics.record(query, perf_counter() - started, len(rows))
+            self.disconnect()
+
+    def copy(self, query: str, file: IO[str]) -> int:
+        """Execute a `COPY ... FROM STDIN` statement, reading the data from the file.
+
+        Returns:
+            int: number of copied rows.
+        """
+        self.connect()
+        started = perf_counter()
+        try:
+            self._cursor.copy_expert(query, file)
+            return self._cursor.rowcount
         finally:
+            self._statistics.record(query, perf_counter() - started, self._cursor.rowcount)
             self.disconnect()
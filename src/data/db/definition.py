@@ -1,10 +1,11 @@
-from typing import List, Type, override
+from typing import Iterator, List, Type, override
 
-from centralized_data import YamlAsset, YamlAssetLoader
 from centralized_data import YamlAsset, YamlAssetLoader
 from discord import Client
 
-from data.db.sql import _SQL, ReadOnlyConnection, Record
+from data.db.notifications import NOTIFY_FUNCTION, ROUTING_COLUMNS
+from data.db.migrations import LiveSchema, MigrationStep, SchemaMigrator
+from data.db.sql import _BasicConnection, Record, SchemaCatalog, Transaction
 from utils.functions import filter_choices_by_current, is_null_or_unassigned
 from discord.app_commands import Choice
 
@@ -17,30 +18,70 @@ class TableDefinition(YamlAsset):
     def columns(self) -> List[dict]:
         return self.source.get("columns", [])
 
-    def to_sql_create(self) -> str:
-        """Get Create Table SQL statement."""
-        return f'CREATE TABLE IF NOT EXISTS {self.name}()'
+    @property
+    def indexes(self) -> List[dict]:
+        """Secondary indexes. Keys: `name`, `columns`, optional `unique` and `where` (partial index)."""
+        return self.source.get("indexes", [])
 
-    def to_sql_alter(self) -> str:
-        """Get Alter Table SQL statement."""
-        columns = ''
-        for column_object in self.columns:
-            column: dict = column_object
-            unique = 'unique' if column.get('unique', False) else ''
+    @property
+    def foreign_keys(self) -> List[dict]:
+        """Keys: `name`, `columns`, `references` (e.g. `events (id)`), optional `on_delete`."""
+        return self.source.get("foreign_keys", [])
 
-            if columns:
-                columns = ", ".join([columns, f'add column if not exists {column["name"]} {column["type"]} {unique}'])
-            else:
-                columns = f'add column if not exists {column["name"]} {column["type"]} {unique}'
+    def index_name(self, index: dict) -> str:
+        return f'{self.name}_{index["name"]}_idx'
 
-            if column.get("primary_key", False):
-                txt = f'drop constraint if exists {self.name}_pkey, add primary key ({column["name"]})'
-                if columns:
-                    columns = ", ".join([columns, txt])
-                else:
-                    columns = txt
+    def foreign_key_name(self, foreign_key: dict) -> str:
+        return f'{self.name}_{foreign_key["name"]}_fkey'
 
-        return f'alter table {self.name} {columns}'
+    @property
+    def primary_key(self) -> List[str]:
+        return [column['name'] for column in self.columns if column.get('primary_key', False)]
+
+    @property
+    def notify_columns(self) -> List[str]:
+        """Columns sent with the change notifications of this table."""
+        names = [column['name'] for column in self.columns]
+        return self.primary_key + [name for name in ROUTING_COLUMNS if name in names and name not in self.primary_key]
+
+    @property
+    def trigger_name(self) -> str:
+        return f'{self.name}_notify_change'
+
+    @property
+    def trigger_function_call(self) -> str:
+        return f'{NOTIFY_FUNCTION}({", ".join(f"\'{name}\'" for name in self.notify_columns)})'
+
+    def to_sql_column(self, column: dict) -> str:
+        """Get the column definition as used by Create Table and Add Column."""
+        unique = ' unique' if column.get('unique', False) and not column.get('primary_key', False) else ''
+        return f'{column["name"]} {column["type"]}{unique}'
+
+    def to_sql_create(self) -> str:
+        """Get Create Table SQL statement."""
+        definitions = [self.to_sql_column(column) for column in self.columns]
+        if self.primary_key:
+            definitions.append(f'primary key ({", ".join(self.primary_key)})')
+        return f'create table {self.name} ({", ".join(definitions)})'
+
+    def to_sql_index(self, index: dict) -> str:
+        """Get Create Index SQL statement."""
+        unique = 'unique ' if index.get('unique', False) else ''
+        where = f' where {index["where"]}' if index.get('where') else ''
+        return f'create {unique}index {self.index_name(index)} on {self.name} ({", ".join(index["columns"])}){where}'
+
+    def to_sql_foreign_key(self, foreign_key: dict) -> str:
+        """Get Add Constraint SQL statement. Existing rows are not validated,
+        so that legacy orphans do not block the startup."""
+        on_delete = f' on delete {foreign_key["on_delete"]}' if foreign_key.get('on_delete') else ''
+        return (f'alter table {self.name} add constraint {self.foreign_key_name(foreign_key)} '
+                f'foreign key ({", ".join(foreign_key["columns"])}) '
+                f'references {foreign_key["references"]}{on_delete} not valid')
+
+    def to_sql_trigger(self) -> str:
+        """Get Create Trigger SQL statement for the change notifications."""
+        return (f'create trigger {self.trigger_name} after insert or update or delete on {self.name} '
+                f'for each row execute function {self.trigger_function_call}')
 
 class TableDefinitions(YamlAssetLoader[TableDefinition]):
     @override
@@ -49,63 +90,63 @@ class TableDefinitions(YamlAssetLoader[TableDefinition]):
     @override
     def asset_class(self) -> Type[TableDefinition]: return TableDefinition
 
-    def _migrate_pings_to_roles(self) -> None:
-        if next((table for table in self.loaded_assets if table.name == 'pings'), None) is None:
+    def _migrate_pings_to_roles(self, transaction: _BasicConnection, live: LiveSchema) -> None:
+        if 'pings' not in live.columns:
             return
 
-        for record in _SQL('pings').select(all=True):
+        roles = []
+        for record in transaction.sql('pings').select_iter():
             if is_null_or_unassigned(record['ping_type']):
                 record['ping_type'] += 3 #type: ignore
 
-            _SQL('roles').insert(Record(
+            roles.append(Record(
                 guild_id=record['guild_id'],
                 role_id=record['tag'],
                 event_type=record['schedule_type'],
                 function=record['ping_type']
             ))
-            _SQL('pings').delete(f'id={record["id"]}')
-        _SQL('pings').drop()
+        transaction.sql('roles').insert_many(roles)
+        transaction.sql('pings').drop()
 
-    def _migrate_events_to_event_users(self) -> None:
-        events_table = next((table for table in self.loaded_assets if table.name == 'events'))
-        assert events_table is not None, "Events table not loaded."
-        if next((True for column in events_table.columns if column.get('name') == 'pl1'), None) is not None:
+    def _migrate_events_to_event_users(self, transaction: _BasicConnection, live: LiveSchema) -> None:
+        if 'pl1' not in live.columns.get('events', {}):
             return
 
-        for record in _SQL('events').select(all=True):
-            users = [
-                record['pl1'], record['pl2'], record['pl3'],
-                record['pl4'], record['pl5'], record['pl6'],
-                record['pls']
-            ]
-            for i, user_id in enumerate(users):
-                if user_id is None: continue
-                user_name = '<migrated user, name not available>'
-                _SQL('event_users').insert(Record(
-                    event_id=record['id'],
-                    user_id=user_id,
-                    user_name=user_name,
-                    party=i+1,
-                    is_party_leader=True
-                ))
-            _SQL('events').update(Record(
-                pl1=None, pl2=None, pl3=None,
-                pl4=None, pl5=None, pl6=None,
-                pls=None
-            ), where=f'id={record["id"]}')
-
-        with ReadOnlyConnection() as batch:
-            batch._database.query('alter table events drop column if exists pl1')
-            batch._database.query('alter table events drop column if exists pl2')
-            batch._database.query('alter table events drop column if exists pl3')
-            batch._database.query('alter table events drop column if exists pl4')
-            batch._database.query('alter table events drop column if exists pl5')
-            batch._database.query('alter table events drop column if exists pl6')
-            batch._database.query('alter table events drop column if exists pls')
-
-    def execute_migrations(self) -> None:
-        self._migrate_pings_to_roles()
-        self._migrate_events_to_event_users()
+        def event_users() -> Iterator[Record]:
+            for record in transaction.sql('events').select_iter(fields=['id', 'pl1', 'pl2', 'pl3', 'pl4', 'pl5', 'pl6', 'pls']):
+                users = [
+                    record['pl1'], record['pl2'], record['pl3'],
+                    record['pl4'], record['pl5'], record['pl6'],
+                    record['pls']
+                ]
+                for i, user_id in enumerate(users):
+                    if is_null_or_unassigned(user_id): continue
+                    user_name = '<migrated user, name not available>'
+                    yield Record(
+                        event_id=record['id'],
+                        user_id=user_id,
+                        user_name=user_name,
+                        party=i+1,
+                        is_party_leader=True
+                    )
+
+        transaction.sql('event_users').bulk_load(event_users(), ['event_id', 'user_id', 'user_name', 'party', 'is_party_leader'])
+        transaction.custom_sql('alter table events drop column pl1, drop column pl2, drop column pl3, '
+                               'drop column pl4, drop column pl5, drop column pl6, drop column pls')
+
+    def migration_steps(self) -> List[MigrationStep]:
+        """One-time data migrations, in the order of application. Never rename a released version."""
+        return [
+            MigrationStep('0001_pings_to_roles', self._migrate_pings_to_roles),
+            MigrationStep('0002_events_to_event_users', self._migrate_events_to_event_users)
+        ]
+
+    def refresh_catalog(self) -> None:
+        """Rebuild the in-memory column lists used by `SELECT *` from the table definitions."""
+        catalog = SchemaCatalog()
+        catalog.invalidate()
+        for table in self.loaded_assets:
+            catalog.register(table.name, [column['name'] for column in table.columns])
 
     @classmethod
     def autocomplete(cls, current: str) -> List[Choice]:
@@ -116,9 +157,6 @@ class TableDefinitions(YamlAssetLoader[TableDefinition]):
         super().constructor()
         self.client = client
 
-        with ReadOnlyConnection() as batch:
-            for table in self.loaded_assets:
-                batch._database.query(table.to_sql_create())
-                batch._database.query(table.to_sql_alter())
-
-            self.execute_migrations()
\ No newline at end of file
+        with Transaction() as transaction:
+            SchemaMigrator(transaction).run(self.loaded_assets, self.migration_steps())
+        self.refresh_catalog()
\ No newline at end of file
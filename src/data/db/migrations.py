@@ -0,0 +1,203 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+import re
+from typing import TYPE_CHECKING, Callable, Dict, List, Set, Tuple
+
+from data.db.notifications import notify_function_sql
+from data.db.sql import _BasicConnection, Record
+
+if TYPE_CHECKING:
+    from data.db.definition import TableDefinition
+
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+_TYPE_ALIASES = {
+    'serial': 'integer',
+    'bigserial': 'bigint',
+    'int': 'integer',
+    'bool': 'boolean',
+    'timestamp': 'timestamp without time zone'
+}
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalized_type(column_type: str) -> str:
+    """Spell a YAML column type the way `format_type` reports it."""
+    result = _WHITESPACE.sub(' ', column_type.strip().lower())
+    result = re.sub(r'^varchar', 'character varying', result)
+    return _TYPE_ALIASES.get(result, result)
+
+
+class LiveSchema:
+    """Snapshot of the tables, constraints and indexes of the current schema."""
+
+    def __init__(self, connection: _BasicConnection):
+        self.columns: Dict[str, Dict[str, str]] = {}
+        """Table name -> column name -> formatted type."""
+        self.primary_keys: Dict[str, Tuple[str, List[str]]] = {}
+        """Table name -> (constraint name, columns)."""
+        self.unique_columns: Dict[str, Set[str]] = {}
+        """Table name -> columns with a single column unique or primary key constraint."""
+        self.foreign_keys: Dict[str, Set[str]] = {}
+        self.indexes: Dict[str, Set[str]] = {}
+        self.triggers: Dict[str, Dict[str, str]] = {}
+        """Table name -> trigger name -> trigger definition."""
+
+        for table, column, column_type in connection.custom_sql(
+                'select c.relname, a.attname, format_type(a.atttypid, a.atttypmod) from pg_class c '
+                'join pg_namespace n on n.oid = c.relnamespace '
+                'left join pg_attribute a on a.attrelid = c.oid and a.attnum > 0 and not a.attisdropped '
+                'where n.nspname = current_schema() and c.relkind = \'r\''):
+            columns = self.columns.setdefault(table, {})
+            if column is not None:
+                columns[column] = column_type
+
+        for table, name, constraint_type, columns in connection.custom_sql(
+                'select c.relname, con.conname, con.contype, '
+                '(select array_agg(a.attname::text order by a.attnum) from pg_attribute a '
+                'where a.attrelid = con.conrelid and a.attnum = any(con.conkey)) from pg_constraint con '
+                'join pg_class c on c.oid = con.conrelid '
+                'join pg_namespace n on n.oid = c.relnamespace '
+                'where n.nspname = current_schema()'):
+            if constraint_type == 'p':
+                self.primary_keys[table] = (name, list(columns))
+            if constraint_type in ('p', 'u') and len(columns) == 1:
+                self.unique_columns.setdefault(table, set()).add(columns[0])
+            elif constraint_type == 'f':
+                self.foreign_keys.setdefault(table, set()).add(name)
+
+        for table, name in connection.custom_sql(
+                'select tablename, indexname from pg_indexes where schemaname = current_schema()'):
+            self.indexes.setdefault(table, set()).add(name)
+
+        for table, name, definition in connection.custom_sql(
+                'select c.relname, t.tgname, pg_get_triggerdef(t.oid) from pg_trigger t '
+                'join pg_class c on c.oid = t.tgrelid '
+                'join pg_namespace n on n.oid = c.relnamespace '
+                'where n.nspname = current_schema() and not t.tgisinternal'):
+            self.triggers.setdefault(table, {})[name] = definition
+
+
+class SchemaDiff:
+    """Statements needed to bring the live schema to the table definitions.
+
+    Columns are only ever added; type differences are reported in `warnings`
+    instead of being applied, since they may require a manual data migration."""
+
+    def __init__(self, definitions: List[TableDefinition], live: LiveSchema):
+        self.table_statements: List[str] = []
+        """Tables, columns, primary keys and unique constraints."""
+        self.index_statements: List[str] = []
+        """Indexes, foreign keys and change notification triggers, applied after the data migrations."""
+        self.warnings: List[str] = []
+        for table in definitions:
+            self._diff_table(table, live)
+        for table in definitions:
+            self._diff_indexes(table, live)
+            self._diff_trigger(table, live)
+
+    def _diff_table(self, table: TableDefinition, live: LiveSchema) -> None:
+        live_columns = live.columns.get(table.name)
+        if live_columns is None:
+            self.table_statements.append(table.to_sql_create())
+            return
+
+        changes = []
+        unique_columns = live.unique_columns.get(table.name, set())
+        for column in table.columns:
+            live_type = live_columns.get(column['name'])
+            if live_type is None:
+                changes.append(f'add column {table.to_sql_column(column)}')
+                continue
+            if column.get('unique', False) and not column.get('primary_key', False) and column['name'] not in unique_columns:
+                changes.append(f'add unique ({column["name"]})')
+            if normalized_type(column['type']) != live_type:
+                self.warnings.append(f'{table.name}.{column["name"]} is {live_type}, defined as {column["type"]}')
+
+        primary_key = table.primary_key
+        live_primary_key = live.primary_keys.get(table.name)
+        if primary_key and (live_primary_key is None or live_primary_key[1] != primary_key):
+            if live_primary_key is not None:
+                changes.append(f'drop constraint {live_primary_key[0]}')
+            changes.append(f'add primary key ({", ".join(primary_key)})')
+
+        if changes:
+            self.table_statements.append(f'alter table {table.name} {", ".join(changes)}')
+
+    def _diff_indexes(self, table: TableDefinition, live: LiveSchema) -> None:
+        live_indexes = live.indexes.get(table.name, set())
+        declared_indexes = {table.index_name(index): index for index in table.indexes}
+        for name in sorted(live_indexes):
+            if name.startswith(f'{table.name}_') and name.endswith('_idx') and name not in declared_indexes:
+                self.index_statements.append(f'drop index {name}')
+        for name, index in declared_indexes.items():
+            if name not in live_indexes:
+                self.index_statements.append(table.to_sql_index(index))
+
+        live_foreign_keys = live.foreign_keys.get(table.name, set())
+        declared_foreign_keys = {table.foreign_key_name(foreign_key): foreign_key for foreign_key in table.foreign_keys}
+        for name in sorted(live_foreign_keys):
+            if name.startswith(f'{table.name}_') and name.endswith('_fkey') and name not in declared_foreign_keys:
+                self.index_statements.append(f'alter table {table.name} drop constraint {name}')
+        for name, foreign_key in declared_foreign_keys.items():
+            if name not in live_foreign_keys:
+                self.index_statements.append(table.to_sql_foreign_key(foreign_key))
+
+
+    def _diff_trigger(self, table: TableDefinition, live: LiveSchema) -> None:
+        definition = live.triggers.get(table.name, {}).get(table.trigger_name)
+        if definition is not None and definition.endswith(table.trigger_function_call):
+            return
+        if definition is not None:
+            self.index_statements.append(f'drop trigger {table.trigger_name} on {table.name}')
+        self.index_statements.append(table.to_sql_trigger())
+
+
+@dataclass
+class MigrationStep:
+    """One-time data migration, recorded in the migrations table once applied.
+    Steps must not fail on databases which already have the target layout."""
+    version: str
+    apply: Callable[[_BasicConnection, LiveSchema], None]
+
+
+class SchemaMigrator:
+    """Applies the schema diff and the pending migration steps on one connection."""
+
+    def __init__(self, connection: _BasicConnection):
+        self._connection = connection
+
+    def _execute(self, statements: List[str]) -> None:
+        for statement in statements:
+            self._connection.custom_sql(statement)
+
+    def applied_versions(self) -> Set[str]:
+        return {str(record['version']) for record in self._connection.sql(MIGRATIONS_TABLE).select(fields=['version'])}
+
+    def run(self, definitions: List[TableDefinition], steps: List[MigrationStep]) -> None:
+        from utils.logger import ConsoleLogger
+        live = LiveSchema(self._connection)
+        if MIGRATIONS_TABLE not in live.columns:
+            self._connection.custom_sql(f'create table {MIGRATIONS_TABLE} '
+                                        '(version varchar(100) primary key, applied_at timestamp)')
+
+        diff = SchemaDiff(definitions, live)
+        for warning in diff.warnings:
+            ConsoleLogger().log(f'schema: {warning}')
+        self._execute(diff.table_statements)
+
+        applied = self.applied_versions()
+        for step in steps:
+            if step.version in applied: continue
+            step.apply(self._connection, live)
+            self._connection.sql(MIGRATIONS_TABLE).insert(Record(version=step.version, applied_at=datetime.utcnow()))
+            ConsoleLogger().log(f'schema: applied migration {step.version}')
+
+        self._execute([notify_function_sql()]) # always replaced, so that changes of its body reach existing databases
+        self._execute(diff.index_statements)
+        changes = len(diff.table_statements) + len(diff.index_statements)
+        if changes:
+            ConsoleLogger().log(f'schema: applied {changes} change(s) to the table definitions')
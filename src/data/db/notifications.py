@@ -0,0 +1,149 @@
+from __future__ import annotations
+from asyncio import AbstractEventLoop, Task, get_running_loop
+from dataclasses import dataclass, field
+from json import loads
+from typing import Any, Callable, Dict, List, Optional, Set, override
+
+from centralized_data import Bindable
+import psycopg2
+
+from data.db.database import DatabaseExecutor, open_connection
+
+
+CHANNEL = 'krile_changes'
+NOTIFY_FUNCTION = 'krile_notify_change'
+
+ROUTING_COLUMNS = ['guild_id', 'event_id']
+"""Sent along with the primary key, so that subscribers can tell which part of their cache is affected."""
+
+RESYNC = 'resync'
+"""Operation of the notifications sent after reconnecting, when changes may have been missed."""
+
+
+def notify_function_sql() -> str:
+    """Trigger function sending the table, the operation and the
+    columns passed as trigger arguments as JSON payload."""
+    return (f'create or replace function {NOTIFY_FUNCTION}() returns trigger as $$ '
+            'declare '
+            'changed_row jsonb := to_jsonb(case when TG_OP = \'DELETE\' then OLD else NEW end); '
+            'payload jsonb := jsonb_build_object(\'table\', TG_TABLE_NAME, \'operation\', lower(TG_OP)); '
+            'begin '
+            'for i in 0 .. TG_NARGS - 1 loop '
+            'payload := payload || jsonb_build_object(TG_ARGV[i], changed_row -> TG_ARGV[i]); '
+            'end loop; '
+            f'perform pg_notify(\'{CHANNEL}\', payload::text); '
+            'return null; '
+            'end $$ language plpgsql')
+
+
+@dataclass
+class ChangeNotification:
+    table: str
+    operation: str
+    """`insert`, `update`, `delete` or `resync`."""
+    values: Dict[str, Any] = field(default_factory=dict)
+    """Primary key and routing columns of the changed row."""
+
+    @classmethod
+    def from_payload(cls, payload: str) -> ChangeNotification:
+        values = loads(payload)
+        return cls(values.pop('table'), values.pop('operation'), values)
+
+
+ChangeCallback = Callable[[List[ChangeNotification]], None]
+
+
+class ChangeListener(Bindable):
+    """Receives the change notifications sent by the table triggers
+    and passes them on to the subscribed caches.
+
+    The dedicated connection is watched by the event loop, so no thread
+    waits for notifications. Callbacks receive all notifications of a
+    table which arrived together and run on the `DatabaseExecutor`,
+    since invalidating usually means reloading."""
+
+    RECONNECT_DELAY = 5
+
+    @override
+    def constructor(self) -> None:
+        super().constructor()
+        self._subscribers: Dict[str, List[ChangeCallback]] = {}
+        self._connection: Any = None
+        self._fileno: Optional[int] = None
+        self._loop: Optional[AbstractEventLoop] = None
+        self._pending: Set[Task] = set()
+
+    def subscribe(self, table: str, callback: ChangeCallback) -> None:
+        self._subscribers.setdefault(table, []).append(callback)
+
+    def start(self) -> None:
+        """Start listening. Must be called from the event loop."""
+        if self._loop is not None: return
+        self._loop = get_running_loop()
+        self._connect()
+
+    def _log(self, message: str) -> None:
+        from utils.logger import ConsoleLogger
+        ConsoleLogger().log(message)
+
+    def _connect(self) -> bool:
+        assert self._loop is not None
+        try:
+            self._connection = open_connection()
+            self._connection.set_session(autocommit=True)
+            with self._connection.cursor() as cursor:
+                cursor.execute(f'listen {CHANNEL}')
+        except psycopg2.Error as e:
+            self._log(f'change listener could not connect: {e}')
+            self._close()
+            self._loop.call_later(self.RECONNECT_DELAY, self._reconnect)
+            return False
+        self._fileno = self._connection.fileno()
+        self._loop.add_reader(self._fileno, self._receive)
+        return True
+
+    def _close(self) -> None:
+        if self._fileno is not None and self._loop is not None:
+            self._loop.remove_reader(self._fileno)
+        self._fileno = None
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except psycopg2.Error:
+                pass
+        self._connection = None
+
+    def _reconnect(self) -> None:
+        if self._connect():
+            self._dispatch([ChangeNotification(table, RESYNC) for table in self._subscribers])
+
+    def _receive(self) -> None:
+        assert self._loop is not None
+        try:
+            self._connection.poll()
+        except psycopg2.Error as e:
+            self._log(f'change listener lost its connection: {e}')
+            self._close()
+            self._loop.call_later(self.RECONNECT_DELAY, self._reconnect)
+            return
+        notifications = []
+        while self._connection.notifies:
+            notifications.append(ChangeNotification.from_payload(self._connection.notifies.pop(0).payload))
+        self._dispatch(notifications)
+
+    def _dispatch(self, notifications: List[ChangeNotification]) -> None:
+        assert self._loop is not None
+        by_table: Dict[str, List[ChangeNotification]] = {}
+        for notification in notifications:
+            by_table.setdefault(notification.table, []).append(notification)
+        for table, changes in by_table.items():
+            for callback in self._subscribers.get(table, []):
+                task = self._loop.create_task(self._run(callback, changes))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+
+    async def _run(self, callback: ChangeCallback, notifications: List[ChangeNotification]) -> None:
+        try:
+            await DatabaseExecutor().run(callback, notifications)
+        except Exception as e:
+            self._log(f'invalidating {notifications[0].table} failed: {e}')
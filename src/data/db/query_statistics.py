@@ -0,0 +1,144 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+import os
+import re
+import sys
+from functools import lru_cache
+from threading import Lock
+from types import CodeType, FrameType
+from typing import Dict, List, override
+
+from centralized_data import Bindable
+
+
+LATENCY_BUCKETS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000]
+"""Upper bounds of the latency histogram buckets. Slower statements land in an overflow bucket."""
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\$\d+')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """Normalize a statement so that all executions which only differ
+    by their values share the same fingerprint. Memoized, since the
+    parameterized statements repeat the same few texts."""
+    result = _STRING_LITERAL.sub('?', statement)
+    result = _PLACEHOLDER.sub('?', result)
+    result = _NUMBER_LITERAL.sub('?', result)
+    result = _VALUE_LIST.sub('(...)', result)
+    return _WHITESPACE.sub(' ', result).strip().lower()
+
+
+_SKIPPED_MODULES = ('data.db.', 'concurrent.', 'functools')
+_BASE_MODULES = ('data_providers._base', 'data_writers._base')
+
+
+_SKIPPED, _BASE, _CALLER = range(3)
+_code_kinds: Dict[CodeType, int] = {}
+"""Classification of the code objects seen by `_caller`, so that each frame costs a dict lookup."""
+
+
+def _code_kind(frame: FrameType) -> int:
+    kind = _code_kinds.get(frame.f_code)
+    if kind is None:
+        module = frame.f_globals.get('__name__', '')
+        kind = _BASE if module.startswith(_BASE_MODULES) else _SKIPPED if module.startswith(_SKIPPED_MODULES) else _CALLER
+        _code_kinds[frame.f_code] = kind
+    return kind
+
+
+def _caller() -> str:
+    """First frame outside of the database layer, usually a provider or writer.
+    Calls through the provider and writer base classes are reported with the
+    class of the instance and the base method which was called, e.g.
+    `ButtonsProvider.find`, instead of the shared base method."""
+    frame = sys._getframe(1)
+    entry = None
+    while frame is not None:
+        kind = _code_kind(frame)
+        if kind == _BASE:
+            instance = frame.f_locals.get('self')
+            if instance is not None:
+                entry = f'{type(instance).__name__}.{frame.f_code.co_name}'
+        elif kind == _CALLER:
+            return entry or f'{frame.f_globals.get("__name__", "")}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return entry or '<unknown>'
+
+
+@dataclass
+class StatementStatistics:
+    fingerprint: str
+    calls: int = 0
+    total_time: float = 0.0
+    """In seconds."""
+    max_time: float = 0.0
+    rows: int = 0
+    histogram: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    callers: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def marshal(self) -> dict:
+        return {
+            'fingerprint': self.fingerprint,
+            'calls': self.calls,
+            'total_ms': round(self.total_time * 1000, 3),
+            'mean_ms': round(self.mean_time * 1000, 3),
+            'max_ms': round(self.max_time * 1000, 3),
+            'rows': self.rows,
+            'histogram': {
+                f'<={bound}ms' if i < len(LATENCY_BUCKETS_MS) else f'>{LATENCY_BUCKETS_MS[-1]}ms': count
+                for i, (bound, count) in enumerate(zip(LATENCY_BUCKETS_MS + [None], self.histogram))
+            },
+            'callers': dict(self.callers)
+        }
+
+
+class QueryStatistics(Bindable):
+    """In-process latency statistics of all executed statements, grouped by fingerprint.
+
+    Statements slower than `DB_SLOW_QUERY_MS` (default 500) are logged
+    together with the provider or writer which issued them."""
+
+    @override
+    def constructor(self) -> None:
+        super().constructor()
+        self.slow_query_threshold = float(os.getenv('DB_SLOW_QUERY_MS', '500')) / 1000
+        self._lock = Lock()
+        self._statements: Dict[str, StatementStatistics] = {}
+
+    def record(self, statement: str, elapsed: float, rows: int) -> None:
+        key = fingerprint(statement)
+        caller = _caller()
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed * 1000 <= bound), len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            statistics = self._statements.get(key)
+            if statistics is None:
+                statistics = self._statements[key] = StatementStatistics(key)
+            statistics.calls += 1
+            statistics.total_time += elapsed
+            statistics.max_time = max(statistics.max_time, elapsed)
+            statistics.rows += max(rows, 0)
+            statistics.histogram[bucket] += 1
+            statistics.callers[caller] = statistics.callers.get(caller, 0) + 1
+        if elapsed >= self.slow_query_threshold:
+            from utils.logger import ConsoleLogger
+            ConsoleLogger().log(f'slow query ({elapsed * 1000:.1f}ms, {rows} rows) from {caller}: {key}')
+
+    def top(self, count: int = 10) -> List[StatementStatistics]:
+        """Copies of the statements with the highest total execution time."""
+        with self._lock:
+            return [replace(statistics, histogram=list(statistics.histogram), callers=dict(statistics.callers))
+                    for statistics in sorted(self._statements.values(),
+                                             key=lambda statistics: statistics.total_time, reverse=True)[:count]]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
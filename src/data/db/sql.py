@@ -1,11 +1,16 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
+import csv
 from datetime import datetime
 from enum import Enum
+from io import StringIO
 from json import dumps
-from typing import Any, Callable, Dict, List, Optional, Self, Tuple, TypeVar, Union, overload, override
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Self, Sequence, Tuple, TypeVar, Union, overload, override
 
-from data.db.database import Database, PgColumnValue, pg_timestamp
+from centralized_data import Bindable
+from psycopg2.extras import Json
+
+from data.db.database import DEFAULT_FETCH_SIZE, Database, PgColumnValue
 from utils.basic_types import Unassigned
 from utils.functions import is_null_or_unassigned
 
@@ -42,15 +47,55 @@ class _BasicConnection(ABC):
         """Create a SQL object for the given table name."""
         return _SQL(table_name, self)
 
-    def custom_sql(self, statement: str) -> List[PgColumnValue]:
+    def custom_sql(self, statement: str,
+                   params: Optional[Sequence[Any]] = None,
+                   prepare: bool = False) -> List[PgColumnValue]:
         """Execute a custom SQL statement."""
-        return self._database.query(statement)
+        return self._database.query(statement, params, prepare)
+
+    def custom_sql_many(self, statement: str,
+                        rows: Sequence[Sequence[Any]],
+                        fetch: bool = False) -> List[PgColumnValue]:
+        """Execute a custom SQL statement with a `VALUES %s` placeholder for many rows."""
+        return self._database.query_many(statement, rows, fetch)
+
+    def custom_sql_iter(self, statement: str,
+                        params: Optional[Sequence[Any]] = None,
+                        fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Sequence[PgColumnValue]]:
+        """Stream the rows of a custom SELECT statement through a server-side cursor."""
+        return self._database.query_iter(statement, params, fetch_size)
+
+    def copy(self, statement: str, file: IO[str]) -> int:
+        """Execute a custom `COPY ... FROM STDIN` statement."""
+        return self._database.copy(statement, file)
 
 class Transaction(_BasicConnection):
+    def __init__(self):
+        super().__init__()
+        self._on_commit: List[Callable[[], None]] = []
+
+    def on_commit(self, callback: Callable[[], None]) -> None:
+        """Run the callback once the changes are committed. Outside of
+        a `with` block, every statement is already committed on its own."""
+        if self._database.connected():
+            self._on_commit.append(callback)
+        else:
+            callback()
+
     @override
     def __exit__(self, exc_type, exc_value, traceback) -> None:
-        self._database.disconnect(exc_type is None)
-        if exc_type is not None: raise
+        try:
+            self._database.disconnect(exc_type is None)
+        except Exception:
+            self._on_commit.clear()
+            raise
+        if exc_type is not None:
+            self._on_commit.clear()
+            raise
+        if not self._database.connected():
+            callbacks, self._on_commit = self._on_commit, []
+            for callback in callbacks:
+                callback()
 
 class ReadOnlyConnection(_BasicConnection):
     @override
@@ -62,32 +107,102 @@ class ReadOnlyConnection(_BasicConnection):
 class Records(List[Record]): ...
 
 
+class SchemaCatalog(Bindable):
+    """In-memory column lists of the database tables.
+
+    Filled by `TableDefinitions` from the YAML definitions; tables which
+    are not defined there are looked up in `information_schema` once."""
+
+    @override
+    def constructor(self) -> None:
+        super().constructor()
+        self._columns: Dict[str, List[str]] = {}
+
+    def register(self, table_name: str, columns: List[str]) -> None:
+        self._columns[table_name] = list(columns)
+
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        """Forget the columns of a table, or of all tables if none is given."""
+        if table_name is None:
+            self._columns.clear()
+        else:
+            self._columns.pop(table_name, None)
+
+    def columns(self, table_name: str, connection: Optional[_BasicConnection] = None) -> List[str]:
+        columns = self._columns.get(table_name)
+        if columns is None:
+            records = _SQL('information_schema.columns', connection).select(
+                fields=['column_name'],
+                filter=Record(table_name=table_name),
+                sort_fields=['ordinal_position'],
+                all=True)
+            if not records:
+                raise Exception(f'Table {table_name} does not exist.')
+            columns = [str(record['column_name']) for record in records]
+            self._columns[table_name] = columns
+        return columns
+
+
 class _SQL:
-    def __init__(self, table_name: str, connection: _BasicConnection):
+    def __init__(self, table_name: str, connection: Optional[_BasicConnection] = None):
         self.table_name = table_name
         self._connection = connection
 
-    def _get_all_fields(self) -> List[str]:
-        with ReadOnlyConnection() as connection:
-            records = self.__class__('information_schema.columns', connection).select(
-                fields=['column_name'],
-                where=f'table_name = \'{self.table_name}\'',
-                all=True)
-            if not isinstance(records, Records):
-                raise Exception(f'Table {self.table_name} does not exist.')
+    def _execute(self, statement: str,
+                 params: Optional[List[Any]] = None,
+                 prepare: bool = False,
+                 read_only: bool = False) -> Any:
+        """Execute the statement on the bound connection. Without one,
+        a pooled connection is borrowed for this single statement.
 
-            return [str(record['column_name']) for record in records]
+        Statements built solely from placeholders should be prepared,
+        so that their plan is cached on the server per (table, shape)."""
+        return self._run(lambda connection: connection.custom_sql(statement, params, prepare), read_only)
 
-    def _convert_to_sql(self, value: PgColumnValue) -> str:
-        if isinstance(value, (int, bool)):
-            return str(value)
-        if isinstance(value, str):
-            return f"'{value}'"
-        if isinstance(value, datetime):
-            return pg_timestamp(value)
+    def _run(self, callback: Callable[[_BasicConnection], Any], read_only: bool = False) -> Any:
+        if self._connection is not None:
+            return callback(self._connection)
+        with (ReadOnlyConnection() if read_only else Transaction()) as connection:
+            return callback(connection)
+
+    def _get_all_fields(self) -> List[str]:
+        return SchemaCatalog().columns(self.table_name, self._connection)
+
+    def _to_param(self, value: PgColumnValue) -> Any:
+        if isinstance(value, Enum):
+            return value.value
+        if value is Unassigned:
+            return None
         if isinstance(value, dict):
-            return f"'{dumps(value)}'::json"
-        return 'null'
+            return Json(value)
+        return value
+
+    def _where(self, condition: Record, params: List[Any]) -> str:
+        conditions = []
+        for field, value in condition.items():
+            if isinstance(value, bool) and value == False:
+                conditions.append(f'({field} is null or not {field})') # False filtering for booleans...
+            else:
+                conditions.append(f'{field} = %s')
+                params.append(self._to_param(value))
+        return ' and '.join(conditions)
+
+    def _select_statement(self, fields: List[str], where: str, filter: Optional[Record],
+                          sort_fields: List[str | Tuple[str, bool]], group_by: List[str]) -> Tuple[str, Optional[List[Any]], bool]:
+        params: Optional[List[Any]] = None
+        prepare = not where
+        sql_statement = f'select {", ".join(fields)} from {self.table_name}'
+        if filter is not None:
+            params = []
+            where = self._where(filter, params)
+            prepare = True
+        if where:
+            sql_statement += f' where {where}'
+        if group_by: sql_statement += ' group by ' + ', '.join(group_by)
+        if sort_fields:
+            sort_fields = [(sort_field, True) if not isinstance(sort_field, tuple) else sort_field for sort_field in sort_fields]
+            sql_statement += f' order by {", ".join([f"{sort[0]} {'asc' if sort[1] else 'desc'}" for sort in sort_fields])}'
+        return sql_statement, params, prepare
 
     def select(self, *,
                fields: List[str] = SQL_ALL_FIELDS,
@@ -96,38 +211,147 @@ class _SQL:
                all: bool = True,
                sort_fields: List[str | Tuple[str, bool]] = [],
                group_by: List[str] = []) -> Records:
+        fields, rows = self.select_rows(fields=fields, where=where, filter=filter, all=all,
+                                        sort_fields=sort_fields, group_by=group_by)
+        return Records(Record(zip(fields, row)) for row in rows)
+
+    def select_rows(self, *,
+                    fields: List[str] = SQL_ALL_FIELDS,
+                    where: str = '',
+                    filter: Optional[Record] = None,
+                    all: bool = True,
+                    sort_fields: List[str | Tuple[str, bool]] = [],
+                    group_by: List[str] = []) -> Tuple[List[str], List[Tuple[PgColumnValue, ...]]]:
+        """Like `select`, but returns the selected fields and the plain row tuples,
+        e.g. for `BaseStruct.row_converter`, instead of building a `Record` per row."""
         if fields == SQL_ALL_FIELDS: fields = self._get_all_fields()
         if all is None: all = where == ''
-        sql_statement = f'select {", ".join(fields)} from {self.table_name}'
-        if filter is not None:
-            where = ' and '.join([
-                f'({field} is null or not {field})' # False filtering for booleans...
-                if isinstance(filter[field], bool) and filter[field] == False
-                else f'{field} = {self._convert_to_sql(filter[field])}'
-                for field in filter.keys()
-            ])
-        if where:
-            sql_statement += f' where {where}'
-        if sort_fields:
-            sort_fields = [(sort_field, True) if not isinstance(sort_field, tuple) else sort_field for sort_field in sort_fields]
-            sql_statement += f' order by {", ".join([f"{sort[0]} {'asc' if sort[1] else 'desc'}" for sort in sort_fields])}'
-        if group_by: sql_statement += ' group by ' + ', '.join(group_by)
+        sql_statement, params, prepare = self._select_statement(fields, where, filter, sort_fields, group_by)
         if not all: sql_statement += ' limit 1'
-        records = Records()
-        for sql_record in self._connection.custom_sql(sql_statement):
-            if not isinstance(sql_record, list): continue
-            record = Record()
-            for i, field in enumerate(fields):
-                record[field] = sql_record[i]
-            records.append(record)
-            if not all: break
-        return records
+        return fields, self._execute(sql_statement, params, prepare, read_only=True)
+
+    def select_iter(self, *,
+                    fields: List[str] = SQL_ALL_FIELDS,
+                    where: str = '',
+                    filter: Optional[Record] = None,
+                    sort_fields: List[str | Tuple[str, bool]] = [],
+                    group_by: List[str] = [],
+                    fetch_size: int = DEFAULT_FETCH_SIZE) -> Iterator[Record]:
+        """Like `select(all=True)`, but streams the records through a server-side
+        cursor instead of loading all of them into memory at once."""
+        if fields == SQL_ALL_FIELDS: fields = self._get_all_fields()
+        sql_statement, params, _ = self._select_statement(fields, where, filter, sort_fields, group_by)
+        if self._connection is not None:
+            for sql_record in self._connection.custom_sql_iter(sql_statement, params, fetch_size):
+                yield Record(zip(fields, sql_record))
+        else:
+            with ReadOnlyConnection() as connection:
+                for sql_record in connection.custom_sql_iter(sql_statement, params, fetch_size):
+                    yield Record(zip(fields, sql_record))
+
+    def select_many(self, filters: List[Record], fields: List[str] = SQL_ALL_FIELDS) -> List[Records]:
+        """Select the records matching each of the filters with a single statement,
+        joining the table with the filter values.
+
+        The values are passed as JSON and expanded with `jsonb_populate_recordset`,
+        so that they are typed like the table columns.
+
+        Returns:
+            List: `result[i]` holds the records matching `filters[i]`.
+        """
+        if not filters: return []
+        if fields == SQL_ALL_FIELDS: fields = self._get_all_fields()
+        shapes: Dict[Tuple[str, ...], List[int]] = {}
+        for i, filter in enumerate(filters):
+            shapes.setdefault(tuple(filter.keys()), []).append(i)
+
+        statements = []
+        params: List[Any] = []
+        for shape_index, (shape, indexes) in enumerate(shapes.items()):
+            params.append(Json([{field: self._to_json_value(filters[i][field]) for field in shape} for i in indexes]))
+            conditions = []
+            for field in shape:
+                if all(isinstance(filters[i][field], bool) for i in indexes):
+                    conditions.append(f'coalesce(t.{field}, false) = v.{field}') # False filtering for booleans...
+                else:
+                    conditions.append(f't.{field} = v.{field}')
+            statements.append(
+                f'select {", ".join(f"t.{field}" for field in fields)}, {shape_index}, v.ordinality from {self.table_name} t '
+                f'join jsonb_populate_recordset(null::{self.table_name}, %s) with ordinality as v '
+                f'on {" and ".join(conditions) or "true"}')
+
+        result = [Records() for _ in filters]
+        shape_indexes = list(shapes.values())
+        for sql_record in self._execute(' union all '.join(statements), params, read_only=True):
+            result[shape_indexes[sql_record[-2]][sql_record[-1] - 1]].append(Record(zip(fields, sql_record)))
+        return result
 
     def insert(self, record: Record, returning_field: str = '') -> PgColumnValue:
         fields = ', '.join(record.keys())
-        values = ', '.join([self._convert_to_sql(value) for value in record.values()])
+        values = ', '.join(['%s'] * len(record))
+        returning = f' returning {returning_field}' if returning_field else ''
+        return self._execute(f'insert into {self.table_name} ({fields}) values ({values}){returning}',
+                             [self._to_param(value) for value in record.values()], prepare=True)
+
+    def _fields_of(self, records: List[Record]) -> List[str]:
+        fields: Dict[str, None] = {}
+        for record in records:
+            fields.update(dict.fromkeys(record.keys()))
+        return list(fields)
+
+    def insert_many(self, records: List[Record], returning_field: str = '') -> List[PgColumnValue]:
+        """Insert all records with a single multi-row `VALUES` statement.
+        Fields missing in some of the records are inserted as null.
+
+        Returns:
+            List: values of `returning_field` in the order of the records.
+        """
+        if not records: return []
+        fields = self._fields_of(records)
+        rows = [[self._to_param(record.get(field)) for field in fields] for record in records]
         returning = f' returning {returning_field}' if returning_field else ''
-        return self._connection.custom_sql(f'insert into {self.table_name} ({fields}) values ({values}){returning}')
+        result = self._run(lambda connection: connection.custom_sql_many(
+            f'insert into {self.table_name} ({", ".join(fields)}) values %s{returning}',
+            rows, bool(returning_field)))
+        return [row[0] for row in result]
+
+    def _to_copy_value(self, value: PgColumnValue) -> Any:
+        value = self._to_param(value)
+        if isinstance(value, Json):
+            return dumps(value.adapted)
+        return value
+
+    def bulk_load(self, records: Iterable[Record], fields: List[str], chunk_size: int = DEFAULT_FETCH_SIZE) -> int:
+        """Load large amounts of records using `COPY`.
+        Faster than `insert_many`, but cannot return generated keys.
+        At most `chunk_size` records are buffered before they are copied.
+
+        Returns:
+            int: number of loaded records.
+        """
+        assert chunk_size > 0, 'chunk_size must be positive'
+        statement = f'copy {self.table_name} ({", ".join(fields)}) from stdin with (format csv)'
+
+        def load(connection: _BasicConnection) -> int:
+            loaded = 0
+            file = StringIO()
+            writer = csv.writer(file, quoting=csv.QUOTE_NOTNULL)
+            buffered = 0
+            for record in records:
+                writer.writerow([self._to_copy_value(record.get(field)) for field in fields])
+                buffered += 1
+                if buffered == chunk_size:
+                    file.seek(0)
+                    loaded += connection.copy(statement, file)
+                    file.seek(0)
+                    file.truncate()
+                    buffered = 0
+            if buffered:
+                file.seek(0)
+                loaded += connection.copy(statement, file)
+            return loaded
+
+        return self._run(load)
 
     @overload
     def update(self, record: Record, condition: Record) -> None: ...
@@ -138,14 +362,49 @@ class _SQL:
     """Update records in the table based on a Record and a where clause."""
 
     def update(self, record: Record, condition: Union[Record, str]) -> None:
-        set_fields = ', '.join([f'{field} = {self._convert_to_sql(value)}' for field, value in record.items()])
+        params = [self._to_param(value) for value in record.values()]
+        set_fields = ', '.join([f'{field} = %s' for field in record.keys()])
         if isinstance(condition, str):
-            where = condition
+            self._execute(f'update {self.table_name} set {set_fields} where {condition.replace('%', '%%')}', params)
         elif isinstance(condition, Record):
-            where = ' and '.join([f'{field} = {self._convert_to_sql(value)}' for field, value in condition.items()])
+            where = self._where(condition, params)
+            self._execute(f'update {self.table_name} set {set_fields} where {where}', params, prepare=True)
         else:
             raise TypeError(f'Unsupported type for condition: {type(condition)}')
-        self._connection.custom_sql(f'update {self.table_name} set {set_fields} where {where}')
+
+    def _to_json_value(self, value: PgColumnValue) -> Any:
+        if isinstance(value, Enum):
+            return value.value
+        if value is Unassigned:
+            return None
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    def update_many(self, changes: List[Tuple[Record, Record]]) -> None:
+        """Apply many `update(record, condition)` changes with one statement
+        per combination of updated and condition fields.
+
+        The values are passed as JSON and expanded with `jsonb_populate_recordset`,
+        so that they are typed like the table columns."""
+        shapes: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Tuple[Record, Record]]] = {}
+        for record, condition in changes:
+            if not record: continue
+            assert condition, 'update without condition'
+            shapes.setdefault((tuple(record.keys()), tuple(condition.keys())), []).append((record, condition))
+
+        def run(connection: _BasicConnection) -> None:
+            for (set_fields, condition_fields), shape_changes in shapes.items():
+                values = [{field: self._to_json_value(record[field]) for field in set_fields} for record, _ in shape_changes]
+                conditions = [{field: self._to_json_value(condition[field]) for field in condition_fields} for _, condition in shape_changes]
+                connection.custom_sql(
+                    f'update {self.table_name} t set {", ".join(f"{field} = n.{field}" for field in set_fields)} '
+                    f'from jsonb_populate_recordset(null::{self.table_name}, %s) with ordinality as n '
+                    f'join jsonb_populate_recordset(null::{self.table_name}, %s) with ordinality as k on k.ordinality = n.ordinality '
+                    f'where {" and ".join(f"t.{field} = k.{field}" for field in condition_fields)}',
+                    [Json(values), Json(conditions)])
+
+        if shapes: self._run(run)
 
     @overload
     def delete(self, condition: str) -> None: ...
@@ -157,11 +416,13 @@ class _SQL:
 
     def delete(self, condition: Union[str, Record]) -> None:
         if isinstance(condition, str):
-            self._connection.custom_sql(f'delete from {self.table_name} where {condition}')
+            self._execute(f'delete from {self.table_name} where {condition}')
         elif isinstance(condition, Record):
-            where = ' and '.join([f'{field} = {self._convert_to_sql(condition[field])}' for field in condition.keys()])
-            self._connection.custom_sql(f'delete from {self.table_name} where {where}')
-        raise TypeError(f'Unsupported type for delete: {type(condition)}')
+            params = []
+            where = self._where(condition, params)
+            self._execute(f'delete from {self.table_name} where {where}', params, prepare=True)
+        else:
+            raise TypeError(f'Unsupported type for delete: {type(condition)}')
 
     def drop(self) -> None:
-        self._connection.custom_sql(f'drop table if exists {self.table_name}')
\ No newline at end of file
+        self._execute(f'drop table if exists {self.table_name}')
\ No newline at end of file
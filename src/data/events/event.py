@@ -3,30 +3,38 @@ from utils.basic_types import EventCategory
 from discord import Member
 from indexedproperty import indexedproperty
 from datetime import datetime, timedelta
-from typing import List, Tuple
-from data.db.sql import _SQL, Record, Transaction
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from data.db.sql import _SQL, Record, Transaction, _BasicConnection
 from models.event_template.data import EventTemplateData
 from data.events.event_templates import EventTemplates
 from utils.basic_types import ChannelFunction
 from utils.basic_types import TaskType
 
-from utils.functions import DiscordTimestampType, generate_passcode, get_discord_timestamp, user_display_name
+from utils.functions import DiscordTimestampType, generate_passcode, get_discord_timestamp, is_null_or_unassigned, user_display_name
 
 class EventUserData:
     event_id: int
     _raid_leader: int
-    _party_leaders: List[int]
+    _party_leaders: List[Optional[int]]
+
+    def __init__(self, update: Callable[[Record], None], update_party_leader: Callable[[int, Optional[int]], None]):
+        self._update = update
+        """Writes the changed fields of the event, see `Event.edit`."""
+        self._update_party_leader = update_party_leader
+        """Writes a changed party leader to `event_users`, see `Event.edit`."""
 
     def load(self, event_id: int) -> None:
+        records = _SQL('events').select(fields=USER_FIELDS, filter=Record(id=event_id), all=False)
+        if records:
+            self.load_from_record(event_id, records[0], load_party_leaders([event_id])[event_id])
+
+    def load_from_record(self, event_id: int, record: Record, party_leaders: List[Optional[int]]) -> None:
+        """Fill from a record containing the `USER_FIELDS` of the event
+        and its party leaders as returned by `load_party_leaders`."""
         self.event_id = event_id
-        record = _SQL('events').select(fields=['raid_leader', 'pl1', 'pl2', 'pl3',
-                                              'pl4', 'pl5', 'pl6', 'pls'],
-                                      where=f'id={event_id}')
-        if record:
-            self._raid_leader = record['raid_leader']
-            self._party_leaders = [
-                record['pl1'], record['pl2'], record['pl3'], record['pl4'], record['pl5'], record['pl6'], record['pls']
-            ]
+        self._raid_leader = record['raid_leader']
+        self._party_leaders = party_leaders
 
     @property
     def raid_leader(self) -> int:
@@ -35,21 +43,37 @@ class EventUserData:
     @raid_leader.setter
     def raid_leader(self, value: int) -> None:
         if value == self.raid_leader: return
-        _SQL('events').update(Record(raid_leader=value), f'id={self.event_id}')
-        self.load(self.event_id)
+        self._update(Record(raid_leader=value))
 
     @indexedproperty
-    def party_leaders(self, index: int) -> int:
+    def party_leaders(self, index: int) -> Optional[int]:
         return self._party_leaders[index]
 
     @party_leaders.setter
-    def party_leaders(self, index: int, value: int) -> None:
-        record = Record()
-        record[PL_FIELDS[index]] = value
-        _SQL('events').update(record, f'id={self.event_id}')
-        self.load(self.event_id)
-
-PL_FIELDS = ['pl1', 'pl2', 'pl3', 'pl4', 'pl5', 'pl6', 'pls']
+    def party_leaders(self, index: int, value: Optional[int]) -> None:
+        if value == self._party_leaders[index]: return
+        self._update_party_leader(index, value)
+
+PARTY_COUNT = 7
+"""Parties 1-6 and the support party."""
+USER_FIELDS = ['raid_leader']
+EVENT_FIELDS = ['id', 'event_type', 'pl_post_id', 'timestamp', 'description', 'pass_main',
+                'pass_supp', 'guild_id', 'use_support', *USER_FIELDS]
+"""Columns needed to hydrate an `Event` with `Event.load_from_record`.
+The party leaders are stored in `event_users`, see `load_party_leaders`."""
+
+def load_party_leaders(event_ids: Iterable[int], connection: Optional[_BasicConnection] = None) -> Dict[int, List[Optional[int]]]:
+    """Party leaders of the events with a single query.
+    `result[event_id][party - 1]` is the user ID of the leader, None if the party has none."""
+    result: Dict[int, List[Optional[int]]] = {int(event_id): [None] * PARTY_COUNT for event_id in event_ids}
+    if not result: return result
+    for record in _SQL('event_users', connection).select(
+            fields=['event_id', 'party', 'user_id'],
+            where=f'is_party_leader and event_id in ({", ".join(str(event_id) for event_id in result)})',
+            all=True):
+        if record['party'] in range(1, PARTY_COUNT + 1):
+            result[record['event_id']][record['party'] - 1] = record['user_id']
+    return result
 
 class Event:
     template: EventTemplateData
@@ -72,24 +96,73 @@ class Event:
     def _tasks(self) -> Tasks: ...
 
     def __init__(self):
-        self.users = EventUserData()
+        self.users = EventUserData(self._update, self._update_party_leader)
+        self._pending_changes: Optional[Record] = None
+        self._pending_party_leaders: Dict[int, Optional[int]] = {}
+
+    @contextmanager
+    def edit(self) -> Iterator['Event']:
+        """Collect the changes of the setters within the block and write
+        them with a single UPDATE and reload when the block is left.
+        Nested blocks are part of the outermost one."""
+        if self._pending_changes is not None:
+            yield self
+            return
+        self._pending_changes = Record()
+        try:
+            yield self
+            changes, party_leaders = self._pending_changes, self._pending_party_leaders
+        finally:
+            self._pending_changes = None
+            self._pending_party_leaders = {}
+        self._write(changes, party_leaders)
+
+    def _update(self, changes: Record) -> None:
+        if self._pending_changes is None:
+            self._write(changes, {})
+        else:
+            for field, value in changes.items():
+                self._pending_changes[field] = value
+
+    def _update_party_leader(self, index: int, user_id: Optional[int]) -> None:
+        if self._pending_changes is None:
+            self._write(Record(), {index: user_id})
+        else:
+            self._pending_party_leaders[index] = user_id
+
+    def _write(self, changes: Record, party_leaders: Dict[int, Optional[int]]) -> None:
+        if not changes and not party_leaders: return
+        with Transaction() as transaction:
+            if changes:
+                transaction.sql('events').update(changes, Record(id=self.id))
+            for index, user_id in party_leaders.items():
+                transaction.sql('event_users').delete(Record(event_id=self.id, party=index + 1, is_party_leader=True))
+                if is_null_or_unassigned(user_id): continue
+                transaction.sql('event_users').insert(Record(event_id=self.id,
+                                                             user_id=user_id,
+                                                             user_name=user_display_name(self.guild_id, user_id),
+                                                             party=index + 1,
+                                                             is_party_leader=True))
+        self.load(self.id)
 
     def load(self, id: int) -> None:
-        record = _SQL('events').select(fields=['event_type', 'pl_post_id', 'timestamp',
-                                              'description', 'pass_main', 'pass_supp',
-                                              'guild_id', 'use_support'],
-                                      where=f'id={id}')
-        if record:
-            self.id = id
-            self._recruitment_post = record['pl_post_id']
-            self._time = record['timestamp']
-            self._description = record['description']
-            self.passcode_main = record['pass_main']
-            self.passcode_supp = record['pass_supp']
-            self.guild_id = record['guild_id']
-            self.template = EventTemplates(self.guild_id).get(record['event_type'])
-            self._use_support = self.template.use_support() and record['use_support']
-            self.users.load(id)
+        records = _SQL('events').select(fields=EVENT_FIELDS, filter=Record(id=id), all=False)
+        if records:
+            self.load_from_record(records[0], load_party_leaders([id])[id])
+
+    def load_from_record(self, record: Record, party_leaders: List[Optional[int]]) -> None:
+        """Fill the event and its users from a record containing the `EVENT_FIELDS`
+        and the party leaders of the event as returned by `load_party_leaders`."""
+        self.id = record['id']
+        self._recruitment_post = record['pl_post_id']
+        self._time = record['timestamp']
+        self._description = record['description']
+        self.passcode_main = record['pass_main']
+        self.passcode_supp = record['pass_supp']
+        self.guild_id = record['guild_id']
+        self.template = EventTemplates(self.guild_id).get(record['event_type'])
+        self._use_support = self.template.use_support() and record['use_support']
+        self.users.load_from_record(self.id, record, party_leaders)
 
     def marshal(self) -> dict:
         return {
@@ -113,9 +186,9 @@ class Event:
         }
 
     def unmarshal(self, model: dict) -> None:
-        with Transaction():
+        with self.edit():
             if 'type' in model:
-                self.template = EventTemplates(self.guild_id).get(model['type'])
+                self.type = model['type']
             if 'datetime' in model:
                 self.time = model['datetime']
             if 'description' in model:
@@ -144,8 +217,7 @@ class Event:
     @description.setter
     def description(self, value: str) -> None:
         if value == self._description: return
-        _SQL('events').update(Record(description=value), f'id={self.id}')
-        self.load(self.id)
+        self._update(Record(description=value))
 
     @property
     def short_description(self) -> str:
@@ -157,9 +229,8 @@ class Event:
 
     @time.setter
     def time(self, value: datetime) -> None:
-        if value == self.auto_passcode: return
-        _SQL('events').update(Record(timestamp=value), f'id={self.id}')
-        self.load(self.id)
+        if value == self._time: return
+        self._update(Record(timestamp=value))
 
     @property
     def auto_passcode(self) -> bool:
@@ -169,13 +240,9 @@ class Event:
     def auto_passcode(self, value: bool) -> None:
         if value == self.auto_passcode: return
         if value:
-            _SQL('events').update(Record(pass_main=generate_passcode(),
-                                        pass_supp=generate_passcode(False)),
-                                 f'id={self.id}')
+            self._update(Record(pass_main=generate_passcode(), pass_supp=generate_passcode(False)))
         else:
-            _SQL('events').update(Record(pass_main=0, pass_supp=0),
-                                 f'id={self.id}')
-        self.load(self.id)
+            self._update(Record(pass_main=0, pass_supp=0))
 
     @property
     def dm_title(self) -> str:
@@ -195,8 +262,7 @@ class Event:
     @use_support.setter
     def use_support(self, value: bool) -> None:
         if (value == self._use_support) or not self.template.use_support(): return
-        _SQL('events').update(Record(use_support=value), f'id={self.id}')
-        self.load(self.id)
+        self._update(Record(use_support=value))
 
     @property
     def use_recruitment_posts(self) -> str:
@@ -225,9 +291,12 @@ class Event:
 
     @type.setter
     def type(self, value: str):
+        """Switches the template right away, so that later setters of the
+        same edit session (e.g. `use_support`) check the new one."""
         if value == self.type: return
-        _SQL('events').update(Record(event_type=value), f'id={self.id}')
-        self.load(self.id)
+        self.template = EventTemplates(self.guild_id).get(value)
+        self._use_support = self.template.use_support() and self._use_support
+        self._update(Record(event_type=value))
 
     @property
     def use_recruitment_post_threads(self) -> str:
@@ -304,8 +373,7 @@ class Event:
 
     @recruitment_post.setter
     def recruitment_post(self, value: int) -> None:
-        _SQL('events').update(Record(pl_post_id=value), f'id={self.id}')
-        self.load(self.id)
+        self._update(Record(pl_post_id=value))
 
     def create_tasks(self) -> None:
         self._tasks.add_task(self.time, TaskType.MARK_RUN_AS_FINISHED, {"id": self.id, "guild": self.guild_id})
@@ -2,11 +2,14 @@ from copy import deepcopy
 from dataclasses import dataclass
 from centralized_data import GlobalCollection
 from utils.basic_types import GuildID, TaskType
-from data.db.sql import _SQL, Record
-from data.events.event import Event
+from data.db.notifications import ChangeNotification
+from data.db.sql import _SQL, ReadOnlyConnection, Record
+from data.events.event import EVENT_FIELDS, Event, load_party_leaders
 
 from datetime import datetime
-from typing import List
+from itertools import count
+from threading import RLock
+from typing import Dict, List, Optional, Set
 
 from utils.discord_types import InteractionLike
 from utils.functions import generate_passcode
@@ -25,8 +28,15 @@ class EventLike(dict):
     ...
 
 
+_load_stamps = count()
+"""Orders the loads of the schedules against the arrival of change notifications."""
+
+
 class Schedule(GlobalCollection[GuildID]):
     _list: List[Event]
+    _load_stamp: int
+    _lock: RLock
+    """Serializes `load` and `refresh`, which also run on the database threads of the `ChangeListener`."""
 
     from tasks import Tasks
     @Tasks.bind
@@ -35,17 +45,63 @@ class Schedule(GlobalCollection[GuildID]):
     def constructor(self, key: GuildID = None) -> None:
         super().constructor(key)
         self._list = []
+        self._lock = RLock()
         self.load()
 
     def load(self) -> None:
-        self._list.clear()
-        if self.key is None: return
-        for record in _SQL('events').select(fields=['id'],
-                                           where=f'guild_id = {self.key} and (not finished or finished is null) and (not canceled or canceled is null)',
-                                           all=True):
+        """Load all active events of the guild with one query, and their party leaders with another."""
+        with self._lock:
+            self._load_stamp = next(_load_stamps)
+            self._list = self._select() if self.key is not None else []
+
+    def _select(self, where: str = 'true') -> List[Event]:
+        events = []
+        with ReadOnlyConnection() as connection:
+            records = connection.sql('events').select(fields=EVENT_FIELDS,
+                                                      where=f'guild_id = {int(self.key)} and (not finished or finished is null) and (not canceled or canceled is null) and ({where})',
+                                                      sort_fields=['timestamp'],
+                                                      all=True)
+            party_leaders = load_party_leaders([record['id'] for record in records], connection)
+        for record in records:
             event = Event()
-            event.load(record['id'])
-            self._list.append(event)
+            event.load_from_record(record, party_leaders[record['id']])
+            events.append(event)
+        return events
+
+    def refresh(self, event_ids: Set[int]) -> None:
+        """Reload only the given events. Events which are no longer active are dropped."""
+        if not event_ids or self.key is None: return
+        with self._lock:
+            events = self._select(f'id in ({", ".join(str(int(id)) for id in event_ids)})')
+            self._list = sorted([event for event in self._list if event.id not in event_ids] + events,
+                                key=lambda event: event.time)
+
+    @classmethod
+    def invalidate(cls, notifications: List[ChangeNotification]) -> None:
+        """Reload the changed events of the affected guilds. A schedule which was
+        loaded after the notifications arrived is already up to date."""
+        stamp = next(_load_stamps)
+        changes: Dict[GuildID, Optional[Set[int]]] = {} # None reloads the whole schedule
+        if any(notification.values.get('guild_id') is None for notification in notifications):
+            from bot import Bot
+            changes = {guild.id: None for guild in Bot()._client.guilds}
+        else:
+            for notification in notifications:
+                guild_id = notification.values['guild_id']
+                event_ids = changes.setdefault(guild_id, set())
+                if event_ids is None: continue
+                if notification.values.get('id') is None:
+                    changes[guild_id] = None
+                else:
+                    event_ids.add(notification.values['id'])
+        for guild_id, event_ids in changes.items():
+            schedule = cls(guild_id)
+            with schedule._lock:
+                if schedule._load_stamp > stamp: continue
+                if event_ids is None:
+                    schedule.load()
+                else:
+                    schedule.refresh(event_ids)
 
     def get(self, event_id: int) -> Event:
         return next(event for event in self._list if event.id == event_id)
@@ -1,21 +1,123 @@
 
 from abc import ABC, abstractmethod
-from typing import List, Optional, Type, override
+from copy import copy
+from threading import Lock, RLock
+from typing import Any, Callable, ClassVar, Dict, Iterable, List, Optional, Set, Type, override
 
+from data.db.database import DatabaseExecutor
+from data.db.notifications import RESYNC, ChangeNotification
 from data.db.sql import ReadOnlyConnection, Record
 from models._base import BaseStruct
 from utils.basic_types import Unassigned
 
 
+class StructCache[T: BaseStruct]:
+    """
+    In-memory copy of a table with hash indexes on the given fields.
+    Shared by all instances of a provider and safe to use from several threads.
+    """
+
+    def __init__(self, indexed_fields: List[str]):
+        self._lock = RLock()
+        self._structs: Dict[int, T] = {}
+        self._next_slot = 0
+        self._indexes: Dict[str, Dict[Any, Set[int]]] = {field: {} for field in indexed_fields}
+        self.loaded = False
+        self.generation = 0
+        """Incremented by `invalidate`, so that a load racing with it is not stored."""
+
+    def _add(self, struct: T) -> None:
+        slot = self._next_slot
+        self._next_slot += 1
+        self._structs[slot] = struct
+        for field, index in self._indexes.items():
+            index.setdefault(getattr(struct, field), set()).add(slot)
+
+    def _remove(self, slot: int) -> None:
+        struct = self._structs.pop(slot)
+        for field, index in self._indexes.items():
+            slots = index.get(getattr(struct, field))
+            if slots is None: continue
+            slots.discard(slot)
+            if not slots: del index[getattr(struct, field)]
+
+    def _matching(self, struct: T, is_equal: Callable[[T, T], bool]) -> List[int]:
+        candidates: Optional[Set[int]] = None
+        for field, index in self._indexes.items():
+            value = getattr(struct, field)
+            if value is Unassigned: continue
+            slots = index.get(value, set())
+            if candidates is None or len(slots) < len(candidates):
+                candidates = slots
+        slots = self._structs.keys() if candidates is None else candidates
+        return [slot for slot in sorted(slots) if is_equal(self._structs[slot], struct)]
+
+    def reset(self, structs: Iterable[T], generation: int) -> bool:
+        """Replace the content with a full load. Returns False if the cache was invalidated meanwhile."""
+        with self._lock:
+            if generation != self.generation: return False
+            self._structs.clear()
+            for index in self._indexes.values():
+                index.clear()
+            for struct in structs:
+                self._add(struct)
+            self.loaded = True
+            return True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self.loaded = False
+            self._structs.clear()
+            for index in self._indexes.values():
+                index.clear()
+
+    def find_all(self, struct: Optional[T], is_equal: Callable[[T, T], bool]) -> List[T]:
+        """Copies of the matching structs, so that callers cannot modify the cache."""
+        with self._lock:
+            if struct is None:
+                return [copy(self._structs[slot]) for slot in sorted(self._structs)]
+            return [copy(self._structs[slot]) for slot in self._matching(struct, is_equal)]
+
+    def find_many(self, structs: List[T], is_equal: Callable[[T, T], bool]) -> Optional[List[List[T]]]:
+        """Copies of the matches of each struct. None if the cache is not loaded."""
+        with self._lock:
+            if not self.loaded: return None
+            return [[copy(self._structs[slot]) for slot in self._matching(struct, is_equal)] for struct in structs]
+
+    def replace(self, struct: T, structs: Iterable[T], is_equal: Callable[[T, T], bool]) -> None:
+        """Replace all cached structs matching `struct` with the given ones."""
+        with self._lock:
+            if not self.loaded: return
+            for slot in self._matching(struct, is_equal):
+                self._remove(slot)
+            for new_struct in structs:
+                self._add(new_struct)
+
+
+_caches: Dict[type, StructCache] = {}
+_caches_lock = Lock()
+
+
 class BaseProvider[T: BaseStruct](ABC):
     """
     Provides data from the database.
     """
 
+    cached: ClassVar[bool] = False
+    """Opt-in: keep the table in memory and answer `find`/`find_all` from there.
+    The cache is kept fresh by the writers and the `ChangeListener`."""
+
+    indexed_fields: ClassVar[List[str]] = []
+    """Fields with a hash index in cached mode, usually the ones the provider is filtered by."""
+
     @abstractmethod
     def struct_type(self) -> Type[T]: ...
     """Override to provide the type of the struct this provider works with."""
 
+    @DatabaseExecutor.bind
+    def _executor(self) -> DatabaseExecutor: ...
+
     @override
     def __init__(self):
         super().__init__()
@@ -33,28 +135,72 @@ class BaseProvider[T: BaseStruct](ABC):
         """
         Load the struct from the database and add it to the list.
         """
+        struct_type = self.struct_type()
         with ReadOnlyConnection() as connection:
-            self._list.clear()
-            if struct is None:
-                for record in connection.sql(self.struct_type.db_table_name()).select(all=True):
-                    self._list.append(self.struct_type.from_record(record))
-            else:
-                for record in connection.sql(self.struct_type.db_table_name()).select(filter=struct.to_record(), all=True):
-                    self._list.append(self.struct_type.from_record(record))
+            fields, rows = connection.sql(struct_type.db_table_name()).select_rows(
+                filter=None if struct is None else struct.to_record(), all=True)
+        convert = struct_type.row_converter(fields)
+        self._list = [convert(row) for row in rows]
 
     def find(self, struct: T) -> T:
         """
         Find a struct in the list by comparing it with the provided struct.
         """
-        return next((self.find_all(struct)), None) #type: ignore
+        return next(iter(self.find_all(struct)), None) #type: ignore
 
     def find_all(self, struct: Optional[T] = None) -> List[T]:
         """
         Find all structs in the list that match the provided struct.
         """
-        self._load(struct)
+        if not self.cached:
+            self._load(struct)
+            return self._list
+
+        cache = self._cache
+        if not cache.loaded:
+            generation = cache.generation
+            self._load(None)
+            if not cache.reset(self._list, generation):
+                self._list = [item for item in self._list if struct is None or self._is_equal(item, struct)]
+                return self._list
+        self._list = cache.find_all(struct, self._is_equal)
         return self._list
 
+    def find_many(self, structs: List[T]) -> List[List[T]]:
+        """
+        Find the matching structs for each of the provided structs at once,
+        with a single query in uncached mode, or if the cache was invalidated while loading.
+        `result[i]` holds the matches of `structs[i]`.
+        """
+        if self.cached:
+            if not self._cache.loaded: self.find_all()
+            result = self._cache.find_many(structs, self._is_equal)
+            if result is not None: return result
+        struct_type = self.struct_type()
+        with ReadOnlyConnection() as connection:
+            return [
+                [struct_type.from_record(record) for record in records]
+                for records in connection.sql(struct_type.db_table_name()).select_many([struct.to_record() for struct in structs])
+            ]
+
+    async def find_async(self, struct: T) -> T:
+        """
+        Awaitable `find`, the query runs on a database worker thread.
+        """
+        return await self._executor.run(self.find, struct)
+
+    async def find_all_async(self, struct: Optional[T] = None) -> List[T]:
+        """
+        Awaitable `find_all`, the query runs on a database worker thread.
+        """
+        return await self._executor.run(self.find_all, struct)
+
+    async def find_many_async(self, structs: List[T]) -> List[List[T]]:
+        """
+        Awaitable `find_many`, the query runs on a database worker thread.
+        """
+        return await self._executor.run(self.find_many, structs)
+
     def find_cached(self, struct: T) -> Optional[T]:
         """
         Find a struct in the list by comparing it with the provided struct.
@@ -70,4 +216,56 @@ class BaseProvider[T: BaseStruct](ABC):
         return self._list
 
     def filter(self) -> Optional[Record]:
-        return None
\ No newline at end of file
+        return None
+
+    @property
+    def _cache(self) -> StructCache[T]:
+        with _caches_lock:
+            cache = _caches.get(type(self))
+            if cache is None:
+                cache = _caches[type(self)] = StructCache(self.indexed_fields)
+            return cache
+
+    def cache_written(self, old_struct: Optional[T], new_struct: Optional[T]) -> None:
+        """
+        Write-through of the writers, called once the change is committed.
+        Inserted structs may lack generated keys, so inserts reload the table instead.
+        """
+        if not self.cached: return
+        if old_struct is None:
+            self._cache.invalidate()
+            return
+        if new_struct is not None:
+            new_struct = copy(new_struct)
+            new_struct.mark_clean()
+        self._cache.replace(old_struct, [] if new_struct is None else [new_struct], self._is_equal)
+
+    def invalidate(self, notifications: List[ChangeNotification]) -> None:
+        """
+        `ChangeListener` callback: reload the cached structs matching the
+        key values of the changed rows.
+        """
+        if not self.cached: return
+        cache = self._cache
+        changes: List[Dict[str, Any]] = []
+        for notification in notifications:
+            values = {field: value for field, value in notification.values.items() if value is not None}
+            if notification.operation == RESYNC or not values:
+                cache.invalidate()
+                return
+            if values not in changes: changes.append(values)
+        if not cache.loaded: return
+        with ReadOnlyConnection() as connection:
+            for values in changes:
+                struct = self.struct_type()(**values)
+                cache.replace(struct, [
+                    self.struct_type().from_record(record)
+                    for record in connection.sql(self.struct_type().db_table_name()).select(filter=struct.to_record(), all=True)
+                ], self._is_equal)
+
+    @classmethod
+    def invalidate_all(cls) -> None:
+        """Drop the caches of all providers, e.g. when reloading the bot data."""
+        with _caches_lock:
+            for cache in _caches.values():
+                cache.invalidate()
\ No newline at end of file
@@ -4,6 +4,9 @@ from data_providers._base import BaseProvider
 
 
 class ButtonsProvider(BaseProvider[ButtonStruct]):
+    cached = True
+    indexed_fields = ['button_id', 'message_id', 'event_id']
+
     @override
     def struct_type(self) -> Type[ButtonStruct]:
         return ButtonStruct
\ No newline at end of file
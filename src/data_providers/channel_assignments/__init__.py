@@ -7,6 +7,9 @@ from utils.functions import is_null_or_unassigned
 
 
 class ChannelAssignmentProvider(BaseProvider[ChannelAssignmentStruct]):
+    cached = True
+    indexed_fields = ['guild_id', 'function']
+
     @override
     def struct_type(self) -> type[ChannelAssignmentStruct]:
         return ChannelAssignmentStruct
@@ -1,11 +1,14 @@
 
 
-from typing import override
+from typing import List, override
 from data_providers._base import BaseProvider
 from models.event_template import EventTemplateStruct
 
 
 class EventTemplateProvider(BaseProvider[EventTemplateStruct]):
+    cached = True
+    indexed_fields = ['guild_id', 'event_type']
+
     from data_providers.event_templates.default_event_templates import DefaultEventTemplates
     @DefaultEventTemplates.bind
     def _default_templates(self) -> DefaultEventTemplates: ...
@@ -18,6 +21,18 @@ class EventTemplateProvider(BaseProvider[EventTemplateStruct]):
     def find(self, struct: EventTemplateStruct) -> EventTemplateStruct:
         custom_template = super().find(struct)
         if custom_template is not None: return custom_template
+        return self._default_template(struct)
+
+    @override
+    def find_many(self, structs: List[EventTemplateStruct]) -> List[List[EventTemplateStruct]]:
+        result = super().find_many(structs)
+        for struct, templates in zip(structs, result):
+            if templates: continue
+            default_template = self._default_template(struct)
+            if default_template is not None: templates.append(default_template)
+        return result
+
+    def _default_template(self, struct: EventTemplateStruct) -> EventTemplateStruct:
         data = next(
             (
                 template for template in self._default_templates.loaded_assets
@@ -7,5 +7,8 @@ from models.message_assignment import MessageAssignmentStruct
 class MessageAssignmentsProvider(BaseProvider[MessageAssignmentStruct]):
     """Provider for Message Assignments."""
 
+    cached = True
+    indexed_fields = ['guild_id', 'function', 'message_id']
+
     def struct_type(self) -> type[MessageAssignmentStruct]:
         return MessageAssignmentStruct
@@ -1,5 +1,5 @@
 
-from typing import override
+from typing import List, override
 
 from data_providers._base import BaseProvider
 from models.event_template import EventTemplateStruct
@@ -9,6 +9,9 @@ from utils.functions import is_null_or_unassigned
 
 
 class RoleAssignmentsProvider(BaseProvider[RoleAssignmentStruct]):
+    cached = True
+    indexed_fields = ['guild_id', 'function']
+
     from bot import Bot
     @Bot.bind
     def _bot(self) -> Bot: ...
@@ -18,13 +21,15 @@ class RoleAssignmentsProvider(BaseProvider[RoleAssignmentStruct]):
         return RoleAssignmentStruct
 
     def as_discord_mention_string(self, role: RoleAssignmentStruct) -> str:
-        role_structs = self.find_all(role)
+        return self.mention_string_of(self.find_all(role))
+
+    def mention_string_of(self, role_structs: List[RoleAssignmentStruct]) -> str:
         roles = [
             self._bot.get_role(role.guild_id, role.role_id)
             for role in role_structs
             if not is_null_or_unassigned(role.role_id)
         ]
-        return ' '.join(role.mention for role in roles if not role is not None) if roles else ''
+        return ' '.join(role.mention for role in roles if role is not None)
 
     def find_by_event_template(self, event_template: EventTemplateStruct, role: RoleAssignmentStruct) -> RoleAssignmentStruct:
         assert not is_null_or_unassigned(event_template.guild_id), 'guild ID is required when finding event by event template.'
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Type
+from typing import List, Tuple, Type
+from data.db.database import DatabaseExecutor
 from data_providers._base import BaseProvider
 from models._base import BaseStruct
 from models.context import ExecutionContext
@@ -9,6 +10,9 @@ from models.context import ExecutionContext
 class BaseWriter[T: BaseStruct](ABC):
     """Writes data to datbase."""
 
+    @DatabaseExecutor.bind
+    def _executor(self) -> DatabaseExecutor: ...
+
     @abstractmethod
     def provider(self) -> BaseProvider[T]: ...
 
@@ -24,22 +28,108 @@ class BaseWriter[T: BaseStruct](ABC):
         """Sync a struct with the database."""
         with context:
             context.log(f'syncing {struct.type_name()}.')
-            found_struct = self.provider().find(struct.identity())
+            provider = self.provider()
+            found_struct = provider.find(struct.identity())
             if found_struct is not None: struct = found_struct.intersect(struct)
             self._validate_input(context, struct, found_struct, False)
             if found_struct is None:
                 context.transaction.sql(struct.db_table_name()).insert(struct.to_record())
                 context.log(f'added {struct}.')
-            else:
-                context.transaction.sql(struct.db_table_name()).update(struct.to_record(), found_struct.to_record())
+            elif struct.is_dirty:
+                context.transaction.sql(struct.db_table_name()).update(struct.dirty_record(), found_struct.identity().to_record())
                 context.log(f'changes: {struct.changes_since(found_struct)}')
+            else:
+                context.log('no changes.')
+            context.transaction.on_commit(lambda: provider.cache_written(found_struct, struct))
             context.log(f'synced {struct.type_name()}.')
 
+    def sync_many(self, structs: List[T], context: ExecutionContext) -> None:
+        """Sync many structs with distinct identities at once: one query loads the
+        existing structs, new ones are inserted with a single statement and
+        changed ones are updated with one statement per set of changed fields."""
+        if not structs: return
+        with context:
+            context.log(f'syncing {len(structs)} {structs[0].type_name()} entries.')
+            provider = self.provider()
+            inserts: List[T] = []
+            updates: List[Tuple[T, T]] = []
+            identities = [struct.identity() for struct in structs]
+            for struct, identity, found_structs in zip(structs, identities, provider.find_many(identities)):
+                # without identity values (e.g. a generated ID), a struct can only be new
+                found_struct = found_structs[0] if found_structs and identity.to_record() else None
+                if found_struct is not None: struct = found_struct.intersect(struct)
+                self._validate_input(context, struct, found_struct, False)
+                if found_struct is None:
+                    inserts.append(struct)
+                    context.log(f'added {struct}.')
+                elif struct.is_dirty:
+                    updates.append((found_struct, struct))
+                    context.log(f'changes: {struct.changes_since(found_struct)}')
+            sql = context.transaction.sql(structs[0].db_table_name())
+            sql.insert_many([struct.to_record() for struct in inserts])
+            sql.update_many([(struct.dirty_record(), found_struct.identity().to_record())
+                             for found_struct, struct in updates])
+            def write_through() -> None:
+                for struct in inserts: provider.cache_written(None, struct)
+                for found_struct, struct in updates: provider.cache_written(found_struct, struct)
+            context.transaction.on_commit(write_through)
+            context.log(f'synced {len(structs)} {structs[0].type_name()} entries.')
+
+    def buffer(self, context: ExecutionContext) -> ChangeBuffer[T]:
+        """Collect syncs and write them with a single `sync_many` at the end of the `with` block."""
+        return ChangeBuffer(self, context)
+
     def remove(self, struct: T, context: ExecutionContext) -> None:
         """Override to remove a struct from the database."""
         with context:
             context.log(f'removing {struct.type_name()}.')
-            found_struct = self.provider().find(struct)
+            provider = self.provider()
+            found_struct = provider.find(struct)
             self._validate_input(context, struct, found_struct, True)
             context.transaction.sql(struct.db_table_name()).delete(found_struct.to_record())
-            context.log(f'removed {struct.type_name()}.')
\ No newline at end of file
+            context.transaction.on_commit(lambda: provider.cache_written(found_struct, None))
+            context.log(f'removed {struct.type_name()}.')
+
+    async def sync_async(self, struct: T, context: ExecutionContext) -> None:
+        """Awaitable `sync`, the database work runs on a database worker thread."""
+        await self._executor.run(self.sync, struct, context)
+
+    async def remove_async(self, struct: T, context: ExecutionContext) -> None:
+        """Awaitable `remove`, the database work runs on a database worker thread."""
+        await self._executor.run(self.remove, struct, context)
+
+
+
+class ChangeBuffer[T: BaseStruct]:
+    """Write-behind buffer of a writer. Syncs of the same identity are merged,
+    and everything is written with `sync_many` when the `with` block exits
+    without an exception.
+
+    Usage:
+    ```python
+    with ButtonsWriter().buffer(context) as buffer:
+        for struct in structs:
+            buffer.sync(struct)
+    ```
+    """
+
+    def __init__(self, writer: BaseWriter[T], context: ExecutionContext):
+        self._writer = writer
+        self._context = context
+        self._structs: List[T] = []
+
+    def sync(self, struct: T) -> None:
+        identity = struct.identity()
+        for i, buffered in enumerate(self._structs):
+            if buffered.identity() == identity:
+                self._structs[i] = buffered.intersect(struct)
+                return
+        self._structs.append(struct)
+
+    def __enter__(self) -> ChangeBuffer[T]:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        structs, self._structs = self._structs, []
+        if exc_type is None:
+            self._writer.sync_many(structs, self._context)
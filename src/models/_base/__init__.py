@@ -3,13 +3,16 @@ from abc import ABC, abstractmethod
 from dataclasses import fields
 from datetime import datetime
 from enum import Enum
-from typing import Any, Self
+from typing import Any, Callable, Dict, List, Self, Sequence, Tuple
 
 from data.db.sql import Record
 from utils.basic_types import Unassigned
 from utils.functions import is_null_or_unassigned
 
 
+_row_converters: Dict[Tuple[type, Tuple[str, ...]], Callable[[Sequence[Any]], Any]] = {}
+
+
 class BaseStruct(ABC):
     """Override the class to define the actual data class.
     When creating a new struct, inherit from this class
@@ -22,6 +25,8 @@ class BaseStruct(ABC):
     * `changes_since()`
     * `marshal()`"""
 
+    __slots__ = ('_clean_values',)
+
     def __init__(self):
         super().__init__()
 
@@ -44,8 +49,52 @@ class BaseStruct(ABC):
     def from_record(cls, record: Record) -> Self:
         self = cls(**record)
         self.fixup_types()
+        self.mark_clean()
         return self
 
+    @classmethod
+    def row_converter(cls, fields: Sequence[str]) -> Callable[[Sequence[Any]], Self]:
+        """Compiled function creating a struct from a row tuple of the given fields,
+        equivalent to `from_record` without building a `Record` first.
+        Like there, NULL columns are kept as None."""
+        key = (cls, tuple(fields))
+        converter = _row_converters.get(key)
+        if converter is None:
+            assert all(field.isidentifier() for field in fields), f'invalid field names: {fields}'
+            arguments = ', '.join(f'{field}=row[{i}]' for i, field in enumerate(fields))
+            namespace = {'cls': cls}
+            exec(f'def convert(row):\n'
+                 f'    self = cls({arguments})\n'
+                 f'    self.fixup_types()\n'
+                 f'    self.mark_clean()\n'
+                 f'    return self\n', namespace)
+            converter = _row_converters[key] = namespace['convert']
+        return converter
+
+    def mark_clean(self) -> None:
+        """Remember the current values as the stored state, see `dirty_fields`."""
+        self._clean_values = {field.name: getattr(self, field.name) for field in fields(self)} #type: ignore
+
+    @property
+    def dirty_fields(self) -> List[str]:
+        """Assigned fields whose values differ from the stored state.
+        For structs which were not loaded from the database, all assigned fields are dirty.
+        Changes inside of mutable values (e.g. JSON data) are only noticed when the value is replaced."""
+        clean_values = getattr(self, '_clean_values', None)
+        return [
+            field.name for field in fields(self) #type: ignore
+            if getattr(self, field.name) is not Unassigned
+            and (clean_values is None or clean_values.get(field.name, Unassigned) != getattr(self, field.name))
+        ]
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self.dirty_fields)
+
+    def dirty_record(self) -> Record:
+        """Record of the dirty fields, as needed for a minimal update."""
+        return Record(**{field: getattr(self, field) for field in self.dirty_fields})
+
     @abstractmethod
     def fixup_types(self) -> None: ...
     """Override to fix types that aren't compatible with the database."""
@@ -57,7 +106,11 @@ class BaseStruct(ABC):
         return Record(**self._to_constructor_dict())
 
     def intersect(self, other: Self) -> Self:
+        """Copy of the struct with the assigned values of the other struct.
+        The stored state is kept, so the result is dirty where `other` changes it."""
         result = self.__class__(**self._to_constructor_dict())
+        if hasattr(self, '_clean_values'):
+            result._clean_values = self._clean_values #type: ignore
         for field in fields(other): #type: ignore
             value = getattr(other, field.name)
             if value is not Unassigned:
@@ -7,7 +7,7 @@ from models._base import BaseStruct
 from utils.basic_types import ButtonType, Unassigned
 from utils.functions import fix_enum
 
-@dataclass
+@dataclass(slots=True)
 class ButtonStruct(BaseStruct):
     button_id: str = Unassigned #type: ignore
     button_type: ButtonType = Unassigned #type: ignore
@@ -8,7 +8,7 @@ from utils.basic_types import EurekaInstance, NotoriousMonster, Unassigned, Chan
 from utils.functions import fix_enum
 
 
-@dataclass
+@dataclass(slots=True)
 class ChannelAssignmentStruct(BaseStruct):
     guild_id: int = Unassigned #type: ignore
     id: int = Unassigned #type: ignore
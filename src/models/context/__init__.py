@@ -37,7 +37,7 @@ class ExecutionContext:
     _transaction: Transaction = None #type: ignore
 
     def __enter__(self):
-        if self._level > 0:
+        if self._level == 0:
             self.transaction.__enter__()
 
         self._level += 1
@@ -7,7 +7,7 @@ from utils.basic_types import Unassigned
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class EventStruct(BaseStruct):
     id: int = Unassigned #type: ignore
     guild_id: int = Unassigned #type: ignore
@@ -6,7 +6,7 @@ from models._base import BaseStruct
 from models.event_template.data import EventTemplateData
 from utils.basic_types import Unassigned
 
-@dataclass
+@dataclass(slots=True)
 class EventTemplateStruct(BaseStruct):
     guild_id: int = Unassigned #type: ignore
     event_type: str = Unassigned #type: ignore
@@ -8,7 +8,7 @@ from dataclasses import dataclass
 from utils.functions import is_null_or_unassigned
 
 
-@dataclass
+@dataclass(slots=True)
 class EventUserStruct(BaseStruct):
     id: int = Unassigned #type: ignore
     event_id: int = Unassigned #type: ignore
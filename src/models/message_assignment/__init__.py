@@ -7,7 +7,7 @@ from utils.basic_types import MessageFunction
 from utils.functions import fix_enum
 
 
-@dataclass
+@dataclass(slots=True)
 class MessageAssignmentStruct(BaseStruct):
     id: int = Unassigned #type: ignore
     guild_id: int = Unassigned #type: ignore
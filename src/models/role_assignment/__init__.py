@@ -9,7 +9,7 @@ from dataclasses import dataclass
 from utils.functions import fix_enum
 
 
-@dataclass
+@dataclass(slots=True)
 class RoleAssignmentStruct(BaseStruct):
     id: int = Unassigned #type: ignore
     guild_id: int = Unassigned #type: ignore
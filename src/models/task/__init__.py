@@ -5,10 +5,10 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import override
 from models._base import BaseStruct
-from utils.basic_types import TaskType
+from utils.basic_types import TaskType, Unassigned
 from utils.functions import fix_enum
 
-@dataclass
+@dataclass(slots=True)
 class TaskStruct(BaseStruct):
     id: int = Unassigned #type: ignore
     execution_time: datetime = Unassigned #type: ignore
@@ -1,22 +1,79 @@
 from __future__ import annotations
-from asyncio import sleep
-from json import dumps
-from typing import Any, Callable, List, override
-from datetime import datetime
+from asyncio import AbstractEventLoop, Event, Future, Task as AsyncTask, get_running_loop, wait_for
+from heapq import heapify, heappop, heappush
+from os import getenv, getpid
+from itertools import count
+from socket import gethostname
+from threading import RLock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple, override
+from datetime import datetime, timedelta
 from uuid import uuid4
 
 from utils.basic_types import TaskType
-from data.db.sql import _SQL, Record
-from tasks.task import Task, TaskTemplate
+from data.db.notifications import RESYNC, ChangeNotification
+from data.db.sql import _SQL, ReadOnlyConnection, Record, Transaction
+from tasks.statistics import TaskStatistics
+from tasks.task import DEAD_TASK_FIELDS, DEAD_TASKS_TABLE, TASK_FIELDS, Task, TaskTemplate
 from centralized_data import PythonAssetLoader
 
 class Tasks(PythonAssetLoader[TaskTemplate]):
+    """Runtime and persisted tasks in one priority queue, ordered by
+    execution time and insertion order.
+
+    Removed tasks are only flagged and dropped once they reach the top,
+    so adding or removing a task costs O(log n) and finding the next due
+    task is O(1) amortized. Persisted tasks are written to the database on change,
+    the queue is only read from it by `load`.
+
+    `run` executes the tasks. It sleeps until the earliest execution
+    time and is woken up early when an earlier task is added or a task
+    finished. Due tasks run concurrently on up to `TASK_WORKERS`
+    (default 4) workers, except for tasks with the same
+    `TaskTemplate.serialization_key`, which run one after another in
+    the order they were due, and task types exceeding their
+    `TaskTemplate.concurrency_limit`.
+
+    Several instances may share the tasks table: a persisted task is
+    leased by the instance executing it (`TASK_LEASE_SECONDS`, default
+    300), other instances retry it once the lease expired. Tasks added
+    or removed by other instances arrive as change notifications."""
+
+    CLAIM_RETRY_DELAY = timedelta(seconds=30)
+    """Delay before claiming a task again after the claim failed."""
+    DISPATCH_RETRY_DELAY = timedelta(seconds=5)
+    """Delay before `run` dispatches again after dispatching failed."""
+
+    @TaskStatistics.bind
+    def _statistics(self) -> TaskStatistics: ...
+
     @override
     def constructor(self) -> None:
         super().constructor()
-        self._db_tasks: List[Task] = []
-        self._runtime_tasks: List[Task] = []
-        self.executing: bool = False
+        self._lock = RLock()
+        self._queue: List[Tuple[datetime, int, Task]] = []
+        self._signatures: Dict[Any, Task] = {}
+        self._ids: Dict[int, Task] = {}
+        """Persisted tasks by id."""
+        self._by_type: Dict[TaskType, Set[Task]] = {}
+        self._by_data: Dict[Tuple[TaskType, Hashable], Set[Task]] = {}
+        """Tasks by type and `Task.data_key`."""
+        self._coalescing: Dict[Tuple[TaskType, Hashable], Task] = {}
+        """Coalesced tasks which did not start yet, by type and `TaskTemplate.coalescing_key`."""
+        self._waiters: Dict[Any, List[Tuple[AbstractEventLoop, Future]]] = {}
+        """Futures of `until_over`, by signature."""
+        self._sequence = count()
+        self.worker_count = max(int(getenv('TASK_WORKERS', '4')), 1)
+        self._ready: List[Task] = []
+        """Due tasks waiting for a worker, in the order they were due."""
+        self._running: Set[Task] = set()
+        self._running_keys: Set[Hashable] = set()
+        self._running_types: Dict[TaskType, int] = {}
+        self._workers: Set[AsyncTask] = set()
+        self.owner = getenv('TASK_WORKER_ID') or f'{gethostname()}-{getpid()}'
+        """Name of this instance in the task leases."""
+        self.lease_duration = timedelta(seconds=int(getenv('TASK_LEASE_SECONDS', '300')))
+        self._loop: Optional[AbstractEventLoop] = None
+        self._wakeup: Optional[Event] = None
         self.load()
 
     def task_template(self, type: TaskType) -> TaskTemplate:
@@ -26,98 +83,392 @@ class Tasks(PythonAssetLoader[TaskTemplate]):
     def asset_folder_name(self): return 'tasks'
 
     def load(self):
-        self._db_tasks.clear()
-        for record in _SQL('tasks').select(fields=['id'],
-                                          all=True,
-                                          sort_fields=['execution_time']):
+        with self._lock:
+            tasks = [task for _, _, task in self._queue if task.runtime_only and not task.removed]
+            started = {task.id for task in [*self._ready, *self._running] if not task.runtime_only}
+            for record in _SQL('tasks').select(fields=TASK_FIELDS, all=True):
+                if record['id'] in started: continue
+                task = Task(self.loaded_assets)
+                task.load_from_record(record)
+                known = self._ids.get(task.id)
+                if known is not None:
+                    task.signature = known.signature # keep `until_over` and the callers' signatures valid
+                tasks.append(task)
+            self._queue = []
+            self._signatures = {}
+            self._ids = {}
+            self._by_type = {}
+            self._by_data = {}
+            for task in [*self._ready, *self._running]:
+                if not task.removed: self._register(task)
+            for task in tasks:
+                self._queue.append((task.time, self._register(task), task))
+            heapify(self._queue)
+            self._schedule_recurring()
+            for signature in [signature for signature in self._waiters if signature not in self._signatures]:
+                self._resolve(signature)
+        self._wake()
+
+    def _schedule_recurring(self) -> None:
+        """Queue the first run of the recurring templates which have no task yet."""
+        for template in self.loaded_assets:
+            recurrence = template.recurrence()
+            if recurrence is None or self._by_type.get(template.type()): continue
+            assert template.runtime_only(), f'recurring task {template.type().value} must be runtime only'
             task = Task(self.loaded_assets)
-            task.load(record['id'])
+            task.template = template
+            task.data = None
+            task.occurrence = recurrence.first(datetime.utcnow())
+            task.time = recurrence.jittered(task.occurrence)
+            self._queue.append((task.time, self._register(task), task))
+            heapify(self._queue)
+
+    def _reschedule(self, task: Task) -> None:
+        """Queue the next run of a recurring task. It is computed from the
+        planned time of the previous run, so that the runs do not drift."""
+        recurrence = task.template.recurrence()
+        task.occurrence = recurrence.next(task.occurrence, datetime.utcnow())
+        task.time = recurrence.jittered(task.occurrence)
+        self._push(task)
+
+    def _register(self, task: Task) -> int:
+        """Index the task and return its queue sequence number."""
+        if not hasattr(task, 'signature'):
             task.signature = uuid4()
-            self._db_tasks.append(task)
+        task.sequence = next(self._sequence)
+        self._signatures[task.signature] = task
+        if not task.runtime_only:
+            self._ids[task.id] = task
+        self._by_type.setdefault(task.type, set()).add(task)
+        key = Task.data_key(task.data)
+        if key is not None:
+            self._by_data.setdefault((task.type, key), set()).add(task)
+        return task.sequence
+
+    def _push(self, task: Task, time: Optional[datetime] = None) -> None:
+        """Queue the task at its execution time, or at `time` when it is retried."""
+        with self._lock:
+            if task.removed: return
+            heappush(self._queue, (time or task.time, self._register(task), task))
+            earliest = self._queue[0][2] is task
+        if earliest:
+            self._wake()
+
+    def _wake(self) -> None:
+        """Let `run` recalculate its sleep time. Safe to call from any thread."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
 
-    def sort_runtime_tasks_by_time(self) -> None:
-        self._runtime_tasks = sorted(self._runtime_tasks, key=lambda task: task.time)
+    def _discard(self, task: Task) -> None:
+        task.removed = True
+        self._signatures.pop(task.signature, None)
+        if not task.runtime_only and self._ids.get(task.id) is task:
+            del self._ids[task.id]
+        self._by_type.get(task.type, set()).discard(task)
+        key = Task.data_key(task.data)
+        if key is not None:
+            tasks = self._by_data.get((task.type, key))
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks: del self._by_data[(task.type, key)]
+        self._release_coalescing(task)
+        self._resolve(task.signature)
+
+    def _release_coalescing(self, task: Task) -> None:
+        """Let new requests create a new task instead of merging into this one."""
+        key = task.template.coalescing_key(task.data)
+        if key is not None and self._coalescing.get((task.type, key)) is task:
+            del self._coalescing[(task.type, key)]
+
+    def _resolve(self, signature: Any) -> None:
+        """Finish the `until_over` calls waiting for the signature. Safe to call from any thread."""
+        for loop, future in self._waiters.pop(signature, []):
+            loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
 
     def add_task(self, time: datetime, task_type: TaskType, data: dict = None) -> Any:
-        if self.task_template(task_type).runtime_only():
-            task = Task(self.loaded_assets)
-            task.time = time
+        template = self.task_template(task_type)
+        coalescing_key = template.coalescing_key(data)
+        if coalescing_key is not None:
+            assert template.runtime_only(), f'{task_type.value} tasks must be runtime only to be coalesced'
+        task = Task(self.loaded_assets)
+        task.time = time
+        task.template = template
+        if template.runtime_only():
             task.data = data
-            task.signature = uuid4()
-            task.template = self.task_template(task_type)
-            self._runtime_tasks.append(task)
-            self.sort_runtime_tasks_by_time()
-            return task.signature
+            with self._lock: # a concurrent request for the same key must merge into this task
+                if coalescing_key is not None:
+                    pending = self._coalescing.get((task_type, coalescing_key))
+                    if pending is not None:
+                        pending.merged += 1
+                        self._statistics.record_merge(task_type)
+                        return pending.signature
+                    task.time = time + template.debounce()
+                    self._coalescing[(task_type, coalescing_key)] = task
+                self._push(task)
         else:
-            _SQL('tasks').insert(Record(
-                execution_time=time,
-                task_type=task_type.value,
-                data=dumps(data),
-                description=self.task_template(task_type).description(data, time)
-            ))
-            self.load()
+            with self._lock: # the insert notification must not add the task before it is pushed
+                task.id = _SQL('tasks').insert(Record(
+                    execution_time=time,
+                    task_type=task_type.value,
+                    data=data
+                ), 'id')
+                task.data = Task.stored_data(data)
+                self._push(task)
+        return task.signature
 
     def contains(self, type: TaskType) -> bool:
-        for task in self._db_tasks:
-            if task.type == type:
-                return True
-        return False
+        return bool(self._by_type.get(type))
 
     def contains_signature(self, signature: Any) -> bool:
-        for task in self._runtime_tasks:
-            if task.signature == signature:
-                return True
-        for task in self._db_tasks:
-            if task.signature == signature:
-                return True
-        return False
+        return signature in self._signatures
 
     async def until_over(self, signature: Any):
-        while self.contains_signature(signature):
-            await sleep(1)
-
-    def get_next(self) -> Task:
-        """Gets the next possible task to be executed."""
-        task1, task2 = None, None
-        if self._db_tasks and self._db_tasks[0].time <= datetime.utcnow():
-            task1 = self._db_tasks[0]
-        if self._runtime_tasks and self._runtime_tasks[0].time <= datetime.utcnow():
-            task2 = self._runtime_tasks[0]
-
-        if task1 and task2:
-            if task1.time < task2.time:
-                return task1
+        """Wait until the task was executed or removed."""
+        loop = get_running_loop()
+        with self._lock:
+            if not self.contains_signature(signature): return
+            future = loop.create_future()
+            self._waiters.setdefault(signature, []).append((loop, future))
+        await future
+
+    def _take_due(self) -> None:
+        """Move the due tasks from the heap to the ready list."""
+        now = datetime.utcnow()
+        while self._queue and (self._queue[0][2].removed or self._queue[0][0] <= now):
+            time, _, task = heappop(self._queue)
+            if not task.removed:
+                task.due = time
+                self._ready.append(task)
+
+    def _dispatch(self) -> None:
+        """Start as many ready tasks as the workers, keys and type limits allow."""
+        with self._lock:
+            self._take_due()
+            waiting: List[Task] = []
+            blocked_keys: Set[Hashable] = set()
+            for task in self._ready:
+                if task.removed: continue
+                key = task.key
+                limit = task.template.concurrency_limit()
+                if (len(self._running) >= self.worker_count
+                        or (key is not None and (key in self._running_keys or key in blocked_keys))
+                        or (limit is not None and self._running_types.get(task.type, 0) >= limit)):
+                    if key is not None: blocked_keys.add(key)
+                    waiting.append(task)
+                    continue
+                self._start(task, key)
+            self._ready = waiting
+            self._statistics.record_queue(len(self._queue), len(self._ready), len(self._running))
+
+    def _start(self, task: Task, key: Optional[Hashable]) -> None:
+        assert self._loop is not None
+        self._statistics.record_lag(task.type, (datetime.utcnow() - task.due).total_seconds())
+        self._running.add(task)
+        self._release_coalescing(task)
+        if key is not None: self._running_keys.add(key)
+        self._running_types[task.type] = self._running_types.get(task.type, 0) + 1
+        worker = self._loop.create_task(self._execute(task, key))
+        self._workers.add(worker)
+        worker.add_done_callback(self._workers.discard)
+
+    def _claim(self, task: Task) -> bool:
+        """Lease a persisted task for this instance. A task leased by another
+        instance is queued again for when its lease expires, a task which
+        another instance postponed (e.g. for a retry) is queued again for
+        its new execution time and a task which no longer exists is dropped."""
+        with Transaction() as transaction:
+            rows = transaction.custom_sql(
+                'select lease_owner, lease_expires_at, execution_time, (current_timestamp at time zone \'UTC\') '
+                'from tasks where id = %s for update skip locked', [task.id])
+            if rows:
+                owner, expires_at, execution_time, now = rows[0]
+                if execution_time is not None and execution_time > now:
+                    retry_at = datetime.utcnow() + (execution_time - now)
+                elif owner is None or owner == self.owner or expires_at is None or expires_at <= now:
+                    task.attempts = transaction.custom_sql(
+                        'update tasks set lease_owner = %s, lease_expires_at = %s, '
+                        'attempts = coalesce(attempts, 0) + 1 where id = %s returning attempts',
+                        [self.owner, now + self.lease_duration, task.id]) #type: ignore
+                    return True
+                else:
+                    retry_at = datetime.utcnow() + (expires_at - now)
+            elif transaction.custom_sql('select id from tasks where id = %s', [task.id]):
+                retry_at = datetime.utcnow() + self.lease_duration # being claimed right now
             else:
-                return task2
-        elif task1:
-            return task1
+                retry_at = None
+        if retry_at is None:
+            with self._lock:
+                self._discard(task)
         else:
-            return task2
+            self._push(task, retry_at)
+        return False
+
+    async def _execute(self, task: Task, key: Optional[Hashable]) -> None:
+        from data.db.database import DatabaseExecutor
+        from utils.logger import ConsoleLogger
+        try:
+            claimed = not task.removed
+            if claimed and not task.runtime_only:
+                try:
+                    claimed = await DatabaseExecutor().run(self._claim, task)
+                except Exception as e:
+                    ConsoleLogger().log(f'claiming task {task.type.value} failed: {e}')
+                    self._push(task, datetime.utcnow() + self.CLAIM_RETRY_DELAY)
+                    claimed = False
+            if claimed:
+                if task.runtime_only: task.attempts += 1
+                error = None
+                try:
+                    error = await task.execute()
+                finally:
+                    try:
+                        if task.template.recurrence() is not None and not task.removed:
+                            self._reschedule(task)
+                        elif error is not None and not task.removed and task.template.retry_policy().should_retry(error, task.attempts):
+                            await DatabaseExecutor().run(self._retry, task)
+                        elif error is not None and not task.removed and not task.runtime_only:
+                            await DatabaseExecutor().run(self._dead_letter, task, error)
+                        else:
+                            await DatabaseExecutor().run(self.remove_task, task)
+                    except Exception as e:
+                        ConsoleLogger().log(f'removing task {task.type.value} failed: {e}')
+                        with self._lock:
+                            self._discard(task)
+        finally:
+            with self._lock:
+                self._running.discard(task)
+                if key is not None: self._running_keys.discard(key)
+                self._running_types[task.type] -= 1
+            self._wake()
+
+    def _retry(self, task: Task) -> None:
+        """Queue a failed task again after the backoff of its retry policy."""
+        task.time = datetime.utcnow() + task.template.retry_policy().delay(task.attempts)
+        if not task.runtime_only:
+            _SQL('tasks').update(Record(execution_time=task.time, lease_owner=None, lease_expires_at=None),
+                                 Record(id=task.id))
+        self._push(task)
+
+    def _dead_letter(self, task: Task, error: Exception) -> None:
+        """Move a persisted task which failed for good to the dead letter table."""
+        with Transaction() as transaction:
+            transaction.sql(DEAD_TASKS_TABLE).insert(Record(
+                task_id=task.id,
+                execution_time=task.time,
+                task_type=task.type.value,
+                data=task.data,
+                attempts=task.attempts,
+                error=f'{type(error).__name__}: {error}'[:1000],
+                failed_at=datetime.utcnow()
+            ))
+            transaction.sql('tasks').delete(Record(id=task.id))
+        with self._lock:
+            self._discard(task)
+
+    def dead_letters(self, limit: int = 25) -> List[Record]:
+        """The most recently failed tasks."""
+        with ReadOnlyConnection() as connection:
+            return [Record(zip(DEAD_TASK_FIELDS, row)) for row in connection.custom_sql(
+                f'select {", ".join(DEAD_TASK_FIELDS)} from {DEAD_TASKS_TABLE} order by failed_at desc limit %s', [limit])]
+
+    def replay(self, dead_task_id: int) -> Any:
+        """Queue a failed task again for immediate execution.
+
+        Returns:
+            Any: signature of the new task, None if there is no such failed task."""
+        with self._lock, Transaction() as transaction:
+            records = transaction.sql(DEAD_TASKS_TABLE).select(fields=DEAD_TASK_FIELDS, filter=Record(id=dead_task_id), all=False)
+            if not records: return None
+            record = records[0]
+            task = Task(self.loaded_assets)
+            task.signature = uuid4()
+            task.template = self.task_template(TaskType(record['task_type']))
+            task.time = datetime.utcnow()
+            task.data = record['data'] or None
+            task.id = transaction.sql('tasks').insert(Record(
+                execution_time=task.time,
+                task_type=record['task_type'],
+                data=task.data,
+                attempts=0
+            ), 'id')
+            transaction.sql(DEAD_TASKS_TABLE).delete(Record(id=dead_task_id))
+            transaction.on_commit(lambda: self._push(task))
+        return task.signature
+
+    def _delay(self) -> Optional[float]:
+        """Seconds until the earliest task is due, None without tasks."""
+        with self._lock:
+            while self._queue and self._queue[0][2].removed:
+                heappop(self._queue)
+            if not self._queue: return None
+            return max((self._queue[0][0] - datetime.utcnow()).total_seconds(), 0.0)
+
+    async def run(self) -> None:
+        """Execute the tasks when they are due."""
+        self._loop = get_running_loop()
+        self._wakeup = Event()
+        while True:
+            self._wakeup.clear()
+            try:
+                self._dispatch()
+                delay = self._delay()
+            except Exception as e:
+                from utils.logger import ConsoleLogger
+                ConsoleLogger().log(f'dispatching tasks failed: {e}')
+                delay = self.DISPATCH_RETRY_DELAY.total_seconds()
+            try:
+                await wait_for(self._wakeup.wait(), delay)
+            except TimeoutError:
+                pass
+
+    def invalidate(self, notifications: List[ChangeNotification]) -> None:
+        """Pick up the tasks added and drop the tasks removed by other instances."""
+        if any(notification.operation == RESYNC for notification in notifications):
+            return self.load()
+        with self._lock:
+            for notification in notifications:
+                if notification.operation == 'delete' and (task := self._ids.get(notification.values.get('id'))):
+                    self._discard(task)
+            added = {notification.values.get('id') for notification in notifications
+                     if notification.operation == 'insert' and notification.values.get('id') not in self._ids}
+        if not added: return
+        for record in _SQL('tasks').select(fields=TASK_FIELDS, where=f'id in ({", ".join(str(int(id)) for id in added)})'):
+            task = Task(self.loaded_assets)
+            task.load_from_record(record)
+            with self._lock:
+                if task.id not in self._ids:
+                    self._push(task)
+
+    def _remove(self, tasks: List[Task]) -> None:
+        persisted = [task.id for task in tasks if not task.runtime_only]
+        if persisted:
+            _SQL('tasks').delete(f'id in ({", ".join(str(int(id)) for id in persisted)})')
+        with self._lock:
+            for task in tasks:
+                self._discard(task)
 
     def remove_task(self, task: Task):
-        if task.runtime_only:
-            if task in self._runtime_tasks:
-                self._runtime_tasks.remove(task)
-        else:
-            _SQL('tasks').delete(f'id={task.id}')
-            self.load()
+        if task.removed: return
+        self._remove([task])
 
     def remove_all(self, type: TaskType):
-        if self.task_template(type).runtime_only():
-            self._runtime_tasks = list(filter(lambda task: task.type != type, self._runtime_tasks))
-        else:
-            _SQL('tasks').delete(f'task_type={type.value}')
-            self.load()
+        with self._lock:
+            tasks = list(self._by_type.get(type, ()))
+        self._remove(tasks)
 
     def remove_task_by_data(self, type: TaskType, data: dict):
         if data is None:
             return
 
-        if self.task_template(type).runtime_only():
-            self._runtime_tasks = list(filter(lambda task: task.type != type and task.data == data, self._runtime_tasks))
-        else:
-            _SQL('tasks').delete(f'task_type={type.value} and data=\'{dumps(data)}\'')
-            self.load()
+        if not self.task_template(type).runtime_only():
+            data = Task.stored_data(data)
+        key = Task.data_key(data)
+        with self._lock:
+            if key is None:
+                tasks = [task for task in self._by_type.get(type, ()) if task.data == data]
+            else:
+                tasks = list(self._by_data.get((type, key), ()))
+        self._remove(tasks)
 
     @classmethod
     def run_async_method(cls, method: Callable[...], *args, **kwargs) -> None:
@@ -0,0 +1,124 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+import os
+from threading import Lock
+from typing import Dict, List, override
+
+from centralized_data import Bindable
+
+from utils.basic_types import TaskType
+
+
+LAG_BUCKETS_MS = [10, 100, 1000, 5000, 30000, 60000]
+"""Upper bounds of the scheduling lag histogram buckets. Later starts land in an overflow bucket."""
+
+
+@dataclass
+class TaskTypeStatistics:
+    task_type: TaskType
+    executed: int = 0
+    merged: int = 0
+    """Requests merged into already pending tasks."""
+    total_lag: float = 0.0
+    """Sum of (actual - planned) start times, in seconds."""
+    max_lag: float = 0.0
+    histogram: List[int] = field(default_factory=lambda: [0] * (len(LAG_BUCKETS_MS) + 1))
+
+    @property
+    def mean_lag(self) -> float:
+        return self.total_lag / self.executed if self.executed else 0.0
+
+    def marshal(self) -> dict:
+        return {
+            'task_type': self.task_type.value,
+            'executed': self.executed,
+            'merged': self.merged,
+            'mean_lag_ms': round(self.mean_lag * 1000, 3),
+            'max_lag_ms': round(self.max_lag * 1000, 3),
+            'histogram': {
+                f'<={bound}ms' if i < len(LAG_BUCKETS_MS) else f'>{LAG_BUCKETS_MS[-1]}ms': count
+                for i, (bound, count) in enumerate(zip(LAG_BUCKETS_MS + [None], self.histogram))
+            }
+        }
+
+
+@dataclass
+class QueueStatistics:
+    scheduled: int = 0
+    """Tasks which are not due yet. May include removed tasks which were not dropped from the heap yet."""
+    ready: int = 0
+    """Due tasks waiting for a worker, their key or their type limit."""
+    running: int = 0
+    max_ready: int = 0
+    max_running: int = 0
+
+    def marshal(self) -> dict:
+        return {
+            'scheduled': self.scheduled,
+            'ready': self.ready,
+            'running': self.running,
+            'max_ready': self.max_ready,
+            'max_running': self.max_running
+        }
+
+
+class TaskStatistics(Bindable):
+    """In-process scheduling lag of the executed tasks, grouped by task type,
+    and the depth of the task queue.
+
+    Tasks starting more than `TASK_LAG_WARNING_MS` (default 5000) after
+    their execution time are logged."""
+
+    @override
+    def constructor(self) -> None:
+        super().constructor()
+        self.lag_warning_threshold = float(os.getenv('TASK_LAG_WARNING_MS', '5000')) / 1000
+        self._lock = Lock()
+        self._task_types: Dict[TaskType, TaskTypeStatistics] = {}
+        self._queue = QueueStatistics()
+
+    def _of(self, task_type: TaskType) -> TaskTypeStatistics:
+        statistics = self._task_types.get(task_type)
+        if statistics is None:
+            statistics = self._task_types[task_type] = TaskTypeStatistics(task_type)
+        return statistics
+
+    def record_merge(self, task_type: TaskType) -> None:
+        with self._lock:
+            self._of(task_type).merged += 1
+
+    def record_lag(self, task_type: TaskType, lag: float) -> None:
+        lag = max(lag, 0.0)
+        bucket = next((i for i, bound in enumerate(LAG_BUCKETS_MS) if lag * 1000 <= bound), len(LAG_BUCKETS_MS))
+        with self._lock:
+            statistics = self._of(task_type)
+            statistics.executed += 1
+            statistics.total_lag += lag
+            statistics.max_lag = max(statistics.max_lag, lag)
+            statistics.histogram[bucket] += 1
+        if lag >= self.lag_warning_threshold:
+            from utils.logger import ConsoleLogger
+            ConsoleLogger().log(f'task {task_type.value} started {lag:.1f}s late')
+
+    def record_queue(self, scheduled: int, ready: int, running: int) -> None:
+        with self._lock:
+            self._queue.scheduled = scheduled
+            self._queue.ready = ready
+            self._queue.running = running
+            self._queue.max_ready = max(self._queue.max_ready, ready)
+            self._queue.max_running = max(self._queue.max_running, running)
+
+    @property
+    def queue(self) -> QueueStatistics:
+        with self._lock:
+            return replace(self._queue)
+
+    def all(self) -> List[TaskTypeStatistics]:
+        """Statistics of all executed task types, the most delayed first."""
+        with self._lock:
+            return sorted(self._task_types.values(), key=lambda statistics: statistics.max_lag, reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._task_types.clear()
+            self._queue = QueueStatistics()
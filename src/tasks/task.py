@@ -1,14 +1,76 @@
 from __future__ import annotations
-from typing import Any, List
-from datetime import datetime
+from dataclasses import dataclass
+from json import dumps, loads
+from random import uniform
+from typing import Any, Hashable, List, Optional, Tuple, Type
+from datetime import datetime, timedelta
 
 from utils.basic_types import TaskType
-from data.db.sql import _SQL
+from data.db.sql import _SQL, Record
 from centralized_data import PythonAsset
+from discord import DiscordServerError
+import psycopg2
 from abc import abstractmethod
 
 from utils.logger import guild_log_message
 
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass
+class Recurrence:
+    """Schedule of a recurring task template, see `TaskTemplate.recurrence`."""
+    interval: timedelta
+    aligned: bool = True
+    """Run at multiples of the interval since the epoch, e.g. at every full minute."""
+    jitter: timedelta = timedelta(0)
+    """Maximum random delay of each run. It does not accumulate over the runs."""
+    skip_if_running: bool = True
+    """Skip the runs which became due while the previous run was still executing,
+    instead of catching up on them one after another."""
+    run_at_start: bool = False
+    """Run once immediately, before the first regular run."""
+
+    def first(self, now: datetime) -> datetime:
+        if self.run_at_start: return now
+        if not self.aligned: return now + self.interval
+        return _EPOCH + -((_EPOCH - now) // self.interval) * self.interval
+
+    def next(self, previous: datetime, now: datetime) -> datetime:
+        """The run following `previous`, which is the planned time without jitter."""
+        if self.aligned and self.run_at_start and (previous - _EPOCH) % self.interval:
+            previous = _EPOCH + ((previous - _EPOCH) // self.interval) * self.interval
+        result = previous + self.interval
+        if self.skip_if_running and result <= now:
+            result += ((now - result) // self.interval + 1) * self.interval
+        return result
+
+    def jittered(self, time: datetime) -> datetime:
+        return time + timedelta(seconds=uniform(0, self.jitter.total_seconds())) if self.jitter else time
+
+
+TRANSIENT_ERRORS: Tuple[Type[Exception], ...] = (DiscordServerError, TimeoutError, ConnectionError, psycopg2.OperationalError)
+"""Errors which usually disappear when trying again later."""
+
+
+@dataclass
+class RetryPolicy:
+    """How often a failed task is executed again, see `TaskTemplate.retry_policy`."""
+    max_attempts: int = 1
+    """Including the first execution."""
+    backoff: timedelta = timedelta(seconds=30)
+    """Delay before the first retry, doubled for every following one."""
+    max_backoff: timedelta = timedelta(minutes=30)
+    retryable: Tuple[Type[Exception], ...] = TRANSIENT_ERRORS
+
+    def should_retry(self, e: Exception, attempts: int) -> bool:
+        return attempts < self.max_attempts and isinstance(e, self.retryable)
+
+    def delay(self, attempts: int) -> timedelta:
+        """Delay after the given number of failed attempts."""
+        return min(self.backoff * 2 ** max(attempts - 1, 0), self.max_backoff)
+
+
 class TaskTemplate(PythonAsset):
     @abstractmethod
     def base_asset_class_name(self) -> str: return 'TaskTemplate'
@@ -17,7 +79,7 @@ class TaskTemplate(PythonAsset):
     def type(self) -> TaskType: return TaskType.NONE
 
     async def handle_exception(self, e: Exception, obj: dict) -> None:
-        if obj.get("guild"):
+        if isinstance(obj, dict) and obj.get("guild"):
             await guild_log_message(obj["guild"], e)
         else:
             print(e)
@@ -25,6 +87,33 @@ class TaskTemplate(PythonAsset):
     @abstractmethod
     def runtime_only(self) -> bool: return False
 
+    def serialization_key(self, data: dict) -> Optional[Hashable]:
+        """Tasks with the same key never run concurrently. Defaults to the guild of the task."""
+        return data.get("guild") if isinstance(data, dict) else None
+
+    def concurrency_limit(self) -> Optional[int]:
+        """Maximum number of tasks of this type running at the same time, None for no limit."""
+        return None
+
+    def retry_policy(self) -> RetryPolicy:
+        """Override to retry failed executions. By default tasks are executed once."""
+        return RetryPolicy()
+
+    def coalescing_key(self, data: dict) -> Optional[Hashable]:
+        """Requests for a task whose key equals the key of a task which did not start
+        yet are merged into that task. None for tasks which are never merged.
+        Only supported for runtime only templates."""
+        return None
+
+    def debounce(self) -> timedelta:
+        """Delay of coalesced tasks, during which further requests are merged."""
+        return timedelta(0)
+
+    def recurrence(self) -> Optional[Recurrence]:
+        """Override for templates which the scheduler runs repeatedly by itself.
+        Recurring templates must be runtime only."""
+        return None
+
     @abstractmethod
     def description(self, data: dict, timestamp: datetime) -> str: ...
 
@@ -32,36 +121,85 @@ class TaskTemplate(PythonAsset):
     async def execute(self, data: dict) -> None: pass
 
 
+TASK_FIELDS = ['id', 'execution_time', 'data', 'task_type', 'attempts']
+
+DEAD_TASKS_TABLE = 'dead_tasks'
+"""Persisted tasks which failed and will not be retried anymore."""
+DEAD_TASK_FIELDS = ['id', 'task_id', 'execution_time', 'task_type', 'data', 'attempts', 'error', 'failed_at']
+
 class Task:
     template: TaskTemplate
     id: int
     time: datetime
+    due: datetime
+    """Time of the queue entry which became due, e.g. the retry time of a re-queued task."""
     data: dict
     signature: Any
+    sequence: int
+    """Insertion order, breaks ties between tasks with the same execution time."""
+    removed: bool = False
+    occurrence: datetime
+    """Planned time of a recurring task, without the jitter."""
+    merged: int = 0
+    """Number of requests merged into this task, see `TaskTemplate.coalescing_key`."""
+    attempts: int = 0
+    """Number of executions so far, including the current one."""
     _task_templates: List[TaskTemplate]
 
     def __init__(self, task_templates: List[TaskTemplate]) -> None:
         self._task_templates = task_templates
 
+    @classmethod
+    def data_key(cls, data: dict) -> Optional[Hashable]:
+        """Canonical key of task data with hashable values, e.g. `(('entry_id', 1), ('guild', 2))`.
+        None for data which cannot be used as a key."""
+        if not isinstance(data, dict): return None
+        try:
+            key = tuple(sorted(data.items()))
+            hash(key)
+            return key
+        except TypeError:
+            return None
+
+    @classmethod
+    def stored_data(cls, data: dict) -> dict:
+        """The data as it is read back from the JSON column."""
+        return loads(dumps(data))
+
     def load(self, id: int) -> None:
-        record = _SQL('tasks').select(fields=['execution_time', 'data', 'task_type'],
-                                     where=f'id={id}')
-        if record:
-            self.id = id
-            self.time = record['execution_time']
-            self.data = record['data']
-            self.template = next(task for task in self._task_templates if task.type() == TaskType(record['task_type']))
+        records = _SQL('tasks').select(fields=TASK_FIELDS,
+                                      filter=Record(id=id),
+                                      all=False)
+        if records:
+            self.load_from_record(records[0])
+
+    def load_from_record(self, record: Record) -> None:
+        """Fill from a record containing the `TASK_FIELDS`."""
+        self.id = record['id']
+        self.time = record['execution_time']
+        self.data = record['data']
+        self.attempts = record['attempts'] or 0
+        self.template = next(task for task in self._task_templates if task.type() == TaskType(record['task_type']))
 
     @property
     def type(self) -> TaskType:
         return self.template.type()
 
+    @property
+    def key(self) -> Optional[Hashable]:
+        return self.template.serialization_key(self.data)
+
     @property
     def runtime_only(self) -> bool:
         return self.template.runtime_only()
 
-    async def execute(self) -> None:
+    async def execute(self) -> Optional[Exception]:
+        """Returns the error of a failed execution. Errors are passed
+        to `handle_exception` unless the task will be retried."""
         try:
             await self.template.execute(self.data)
+            return None
         except Exception as e:
-            await self.template.handle_exception(e, self.data)
+            if not self.template.retry_policy().should_retry(e, self.attempts):
+                await self.template.handle_exception(e, self.data)
+            return e
@@ -82,7 +82,7 @@ class EurekaInfoPost(Bindable):
         return result
 
     async def rebuild(self, guild_id: int) -> None:
-        message_assignment_struct = MessageAssignmentsProvider().find(MessageAssignmentStruct(
+        message_assignment_struct = await MessageAssignmentsProvider().find_async(MessageAssignmentStruct(
             guild_id=guild_id,
             function=MessageFunction.EUREKA_INSTANCE_INFO
         ))
@@ -2,6 +2,7 @@ from datetime import date
 from typing import List
 from centralized_data import Bindable
 from discord import Embed, Message, TextChannel
+from data.db.database import DatabaseExecutor
 from data_providers.event_templates import EventTemplateProvider
 from data_providers.events import EventsProvider
 from data_providers.message_assignments import MessageAssignmentsProvider
@@ -23,6 +24,9 @@ class SchedulePost(Bindable):
     @Bot.bind
     def _bot(self) -> Bot: ...
 
+    @DatabaseExecutor.bind
+    def _executor(self) -> DatabaseExecutor: ...
+
     def _embed(self, guild_id: int) -> Embed:
         embed = Embed(title='Upcoming Runs')
         embed.set_thumbnail(url=self._bot.user.avatar.url) #type: ignore literally untrue..
@@ -41,14 +45,17 @@ class SchedulePost(Bindable):
         if not per_date:
             description = f'{description}\n### There are currently no runs scheduled.'
         else:
-            event_templates_provider = EventTemplateProvider()
+            event_types = list(dict.fromkeys(event_struct.event_type for event_struct in event_list))
+            event_templates = {
+                event_type: next(iter(templates), None)
+                for event_type, templates in zip(event_types, EventTemplateProvider().find_many([
+                    EventTemplateStruct(guild_id=guild_id, event_type=event_type) for event_type in event_types
+                ]))
+            }
             for data in per_date:
                 schedule_on_day = ''
                 for event_struct in data._list:
-                    event_template = event_templates_provider.find(EventTemplateStruct(
-                        guild_id=guild_id,
-                        event_type=event_struct.event_type
-                    ))
+                    event_template = event_templates[event_struct.event_type]
                     desc = event_template.data.schedule_entry_text(
                         rl=self._bot.get_member(guild_id, event_struct.raid_leader).mention,
                         time=event_struct.timestamp,
@@ -62,7 +69,7 @@ class SchedulePost(Bindable):
         return embed
 
     async def create(self, channel: TextChannel) -> Message:
-        return await channel.send(embed=self._embed(channel.guild.id))
+        return await channel.send(embed=await self._executor.run(self._embed, channel.guild.id))
 
     def events_per_date(self, event_list: List[EventStruct]) -> List[DateSeparatedScheduleData]:
         """Splits the event list by date."""
@@ -77,7 +84,7 @@ class SchedulePost(Bindable):
         return result
 
     async def rebuild(self, guild_id: int) -> None:
-        message_assignment_struct = MessageAssignmentsProvider().find(MessageAssignmentStruct(
+        message_assignment_struct = await MessageAssignmentsProvider().find_async(MessageAssignmentStruct(
             guild_id=guild_id,
             function=MessageFunction.SCHEDULE
         ))
@@ -86,6 +93,6 @@ class SchedulePost(Bindable):
         if channel is None: return
         message = await channel.fetch_message(message_assignment_struct.message_id)
         if message is None: return
-        message = await message.edit(embed=self._embed(guild_id))
+        message = await message.edit(embed=await self._executor.run(self._embed, guild_id))
         if channel.is_news():
             await message.publish()
\ No newline at end of file
@@ -32,7 +32,7 @@ class UIRecruitmentPost(Bindable):
     async def create(self, guild_id: int, id: int) -> None:
         event = Schedule(guild_id).get(id)
         if event is None or event.category == EventCategory.CUSTOM or not event.use_recruitment_posts: return
-        channel_struct = ChannelAssignmentProvider().find(ChannelAssignmentStruct(
+        channel_struct = await ChannelAssignmentProvider().find_async(ChannelAssignmentStruct(
             guild_id=guild_id,
             function=ChannelFunction.RECRUITMENT,
             event_type=event.type
@@ -55,7 +55,7 @@ class UIRecruitmentPost(Bindable):
     async def rebuild(self, guild_id: int, id: int, recreate_view: bool = False) -> Message:
         event = Schedule(guild_id).get(id)
         if event is None or event.category == EventCategory.CUSTOM or not event.use_recruitment_posts: return
-        channel_struct = ChannelAssignmentProvider().find(ChannelAssignmentStruct(
+        channel_struct = await ChannelAssignmentProvider().find_async(ChannelAssignmentStruct(
             guild_id=guild_id,
             function=ChannelFunction.RECRUITMENT,
             event_type=event.type
@@ -66,7 +66,7 @@ class UIRecruitmentPost(Bindable):
         if message is None: return
         embed = Embed(title=event.recruitment_post_title, description=event.recruitment_post_text)
         if recreate_view:
-            ButtonsWriter().remove(
+            await ButtonsWriter().remove_async(
                 ButtonStruct(message_id=event.recruitment_post),
                 basic_context(0, 0, FileLogger(guild_id)))
             view = PersistentView()
@@ -98,7 +98,7 @@ class UIRecruitmentPost(Bindable):
         return message
 
     async def remove(self, guild_id: int, event: Event) -> None:
-        channel_struct = ChannelAssignmentProvider().find(ChannelAssignmentStruct(
+        channel_struct = await ChannelAssignmentProvider().find_async(ChannelAssignmentStruct(
             guild_id=guild_id,
             function=ChannelFunction.RECRUITMENT,
             event_type=event.type
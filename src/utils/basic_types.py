@@ -144,6 +144,7 @@ class TaskType(Enum):
     POST_SUPPORT_PASSCODE = 'post_support_passcode'
     UPDATE_EUREKA_INFO_POSTS = 'update_eureka_info_posts'
     RUN_ASYNC_METHOD = 'run_async_method'
+    REBUILD_SCHEDULE_POST = 'rebuild_schedule_post'
 
 
 class EurekaInstance(Enum):
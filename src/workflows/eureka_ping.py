@@ -25,20 +25,27 @@ class EurekaPingWorkflow(Bindable):
                 context: ExecutionContext) -> None:
         with context:
             context.log(f'Pinging for notorious monster: {NOTORIOUS_MONSTERS[notorious_monster]} with message: {message}')
-            for guild in self._bot.guilds:
-                channel_struct = ChannelAssignmentProvider().find(ChannelAssignmentStruct(
+            guilds = self._bot.guilds
+            channel_structs = ChannelAssignmentProvider().find_many([
+                ChannelAssignmentStruct(
                     guild_id=guild.id,
                     denominator=ChannelDenominator.NOTORIOUS_MONSTER,
                     notorious_monster=notorious_monster,
                     function=ChannelFunction.NM_PINGS,
-                ))
-                if channel_struct is None: continue
-                role_mention_string = RoleAssignmentsProvider().as_discord_mention_string(RoleAssignmentStruct(
+                ) for guild in guilds
+            ])
+            role_structs = RoleAssignmentsProvider().find_many([
+                RoleAssignmentStruct(
                     guild_id=guild.id,
                     denominator=RoleDenominator.NOTORIOUS_MONSTER,
                     notorious_monster=notorious_monster,
                     function=RoleFunction.NOTORIOUS_MONSTER_NOTIFICATION
-                ))
+                ) for guild in guilds
+            ])
+            for guild, guild_channel_structs, guild_role_structs in zip(guilds, channel_structs, role_structs):
+                if not guild_channel_structs: continue
+                channel_struct = guild_channel_structs[0]
+                role_mention_string = RoleAssignmentsProvider().mention_string_of(guild_role_structs)
                 channel = self._bot.get_text_channel(channel_struct.channel_id)
                 Tasks.run_async_method(
                     channel.send,